@@ -1,4 +1,4 @@
-__all__ = ['vsfm_data', 'vsfmpy']
+__all__ = ['vsfm_data', 'vsfmpy', 'vsfm_nvm']
 import logging
 def setup_logger(name, loglevel = logging.INFO):
     logger = logging.getLogger(name)
@@ -0,0 +1,77 @@
+import os
+import socket
+import tempfile
+import threading
+import time
+
+import pytest
+
+import vsfmpy
+
+def start_stub_vsfm(delay=0.0):
+    """
+    Starts a stub VSFM on one end of a socket pair. It prints a progress line ending in 'done' for every command,
+    then acknowledges it after delay seconds
+    :return: the socket to send commands on
+    """
+    client, server = socket.socketpair()
+
+    def serve():
+        buffer = b''
+        with server:
+            while True:
+                try:
+                    data = server.recv(4096)
+                    if not data:
+                        return
+                    buffer += data
+                    while b'\n' in buffer:
+                        line, buffer = buffer.split(b'\n', 1)
+                        server.sendall(b'Loading ' + line + b' ... done\n')
+                        time.sleep(delay)
+                        server.sendall(b'*command processed*\n')
+                except OSError:
+                    return
+
+    threading.Thread(target=serve, daemon=True).start()
+    return client
+
+def test_progress_lines_are_not_acknowledgements():
+    with start_stub_vsfm() as sock:
+        commands = [(('file', 'open_multi_images'), 'image' + str(index) + '.jpg') for index in range(3)]
+        acknowledged, transcript = vsfmpy.send_vsfm_commands(sock, commands, timeout=5)
+        assert acknowledged == 3
+        assert len(transcript) == 6
+        assert transcript[-1] == vsfmpy.vsfm_ack_flag
+        assert vsfmpy._pending_acks.get(sock, 0) == 0
+
+def test_wait_until_complete_waits_for_the_acknowledgement():
+    with start_stub_vsfm(delay=0.2) as sock:
+        begin = time.time()
+        assert vsfmpy.send_vsfm_command_tup(sock, ('sfm', 'reconstruct_sparse'), wait=True, timeout=5)
+        assert time.time() - begin >= 0.2
+
+def test_discard_waits_for_every_pending_acknowledgement():
+    with start_stub_vsfm(delay=0.05) as sock:
+        commands = [(('view', 'image_thumbnails'), None)] * 3
+        vsfmpy.send_vsfm_commands(sock, commands, wait=False)
+        assert vsfmpy.discard_vsfm_responses(sock, timeout=5)
+        assert vsfmpy._pending_acks.get(sock, 0) == 0
+        vsfmpy.send_vsfm_commands(sock, commands[0:1], wait=False)
+        complete, transcript = vsfmpy.read_vsfm_response(sock, timeout=5)
+        assert complete
+        assert transcript == ['Loading ' + str(vsfmpy.vsfm_command_number(('view', 'image_thumbnails'))) + ' ... done',
+                              vsfmpy.vsfm_ack_flag]
+
+def test_open_image_list_removes_the_list_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp_path))
+    with start_stub_vsfm() as sock:
+        assert vsfmpy.open_image_list(sock, ['a.jpg', 'b.jpg'], timeout=5)
+        assert os.listdir(str(tmp_path)) == []
+        list_path = vsfmpy.open_image_list(sock, ['a.jpg', 'b.jpg'], wait=False)
+        assert os.path.exists(list_path)
+        os.remove(list_path)
+    # the socket is closed now, so sending fails
+    with pytest.raises(OSError):
+        vsfmpy.open_image_list(sock, ['a.jpg', 'b.jpg'])
+    assert os.listdir(str(tmp_path)) == []
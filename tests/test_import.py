@@ -0,0 +1,17 @@
+import os
+import subprocess
+import sys
+
+repo_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_import_is_lazy():
+    """
+    Importing vsfmpy must not pull in the heavy optional modules, they are only loaded when first needed
+    """
+    code = ("import sys\n"
+            "import vsfmpy\n"
+            "print(' '.join(name for name in ('numpy', 'cv2', 'tkinter', 'asyncio') if name in sys.modules))\n")
+    result = subprocess.run([sys.executable, '-c', code], cwd=repo_path, stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE, universal_newlines=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split() == []
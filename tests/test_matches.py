@@ -0,0 +1,61 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+import vsfmpy
+
+def write_matches(tmp_path, filenames, text=None):
+    match_path = str(tmp_path / 'matches.txt')
+    if text is not None:
+        with open(match_path, 'w') as fileobj:
+            fileobj.write(text)
+        return match_path
+    pair_matches = [(0, 1, np.array([1, 2, 3]), np.array([4, 5, 6])), (0, 2, np.array([7]), np.array([8])),
+                    (1, 2, np.array([], dtype=np.int64), np.array([], dtype=np.int64))]
+    vsfmpy.write_feature_match_arrays(pair_matches, filenames, match_path)
+    return match_path
+
+def test_read_matches(tmp_path):
+    filenames = ['a.sift', 'b.sift', 'c.sift']
+    match_path = write_matches(tmp_path, filenames)
+    blocks = list(vsfmpy.iter_feature_matches(match_path))
+    assert [block[0:2] for block in blocks] == [('a.sift', 'b.sift'), ('a.sift', 'c.sift'), ('b.sift', 'c.sift')]
+    assert blocks[0][2].tolist() == [1, 2, 3]
+    assert blocks[0][3].tolist() == [4, 5, 6]
+    assert len(blocks[2][2]) == 0
+    query_idx, train_idx = vsfmpy.read_feature_match_pair(match_path, 'a.sift', 'c.sift')
+    assert query_idx.tolist() == [7]
+    assert train_idx.tolist() == [8]
+
+def test_filenames_with_spaces(tmp_path):
+    same_directory = ['/a b/img1.sift', '/a b/img2.sift', '/a b/img 3.sift']
+    match_path = write_matches(tmp_path, same_directory)
+    assert set(vsfmpy.index_feature_matches(match_path)) == {(same_directory[0], same_directory[1]),
+                                                            (same_directory[0], same_directory[2]),
+                                                            (same_directory[1], same_directory[2])}
+    assert vsfmpy.read_feature_match_pair(match_path, '/a b/img1.sift', '/a b/img 3.sift')[0].tolist() == [7]
+    other_directories = ['/a b/img1.sift', '/c d/img2.sift', '/e/img3.sift']
+    match_path = write_matches(tmp_path, other_directories)
+    with pytest.raises(ValueError):
+        vsfmpy.index_feature_matches(match_path)
+    index = vsfmpy.index_feature_matches(match_path, other_directories)
+    assert (other_directories[0], other_directories[1]) in index
+    blocks = list(vsfmpy.iter_feature_matches(match_path, other_directories))
+    assert blocks[0][0:2] == ('/a b/img1.sift', '/c d/img2.sift')
+
+@pytest.mark.parametrize('text', ["a.sift b.sift 3\n1 2 x\n4 5 6\n",
+                                  "a.sift b.sift 3\n1 2\n4 5 6\n",
+                                  "a.sift b.sift 3\n1 2 3.5\n4 5 6\n"])
+def test_malformed_indices(tmp_path, text):
+    with pytest.raises(ValueError):
+        list(vsfmpy.iter_feature_matches(write_matches(tmp_path, None, text)))
+
+def test_parallel_writer_matches_serial(tmp_path):
+    rng = np.random.default_rng(0)
+    filenames = ['img' + str(index) + '.sift' for index in range(12)]
+    pair_matches = [(i, j, rng.integers(0, 5000, 50), rng.integers(0, 5000, 50))
+                    for i in range(12) for j in range(i + 1, 12)]
+    serial_path, parallel_path = str(tmp_path / 'serial.txt'), str(tmp_path / 'parallel.txt')
+    vsfmpy.write_feature_match_arrays(pair_matches, filenames, serial_path)
+    vsfmpy.write_feature_match_arrays(iter(pair_matches), filenames, parallel_path, workers=2)
+    with open(serial_path, 'rb') as serial, open(parallel_path, 'rb') as parallel:
+        assert serial.read() == parallel.read()
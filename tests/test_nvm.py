@@ -0,0 +1,76 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+import vsfm_nvm
+
+nvm_text = ("NVM_V3\n"
+            "\n"
+            "2\n"
+            "kermit000.jpg\t1484.81 0.999 0.01 -0.02 0.003 0.1 -0.2 0.3 -0.0123 0\n"
+            "kermit001.jpg\t1490.2 0.998 0.011 -0.021 0.0031 0.4 -0.5 0.6 1e-05 0\n"
+            "3\n"
+            "1.5 2.5 3.5 255 128 0 2 0 10 -12.5 30.25 1 22 -11 31\n"
+            "-0.25 0.75 10 1 2 3 1 1 5 100 -200\n"
+            "7 8 9 10 11 12 3 0 1 1 1 1 2 2 2 0 3 3 3\n"
+            "\n"
+            "0\n"
+            "\n"
+            "#the last part of NVM file points to the PLY files\n"
+            "#the first number is the number of associated PLY files\n"
+            "#each following number gives a model-index that has PLY\n"
+            "0\n")
+
+def write_text(tmp_path, text):
+    filename = str(tmp_path / 'model.nvm')
+    with open(filename, 'w') as fileobj:
+        fileobj.write(text)
+    return filename
+
+def test_read_nvm(tmp_path):
+    models = vsfm_nvm.read_nvm(write_text(tmp_path, nvm_text))
+    assert len(models) == 1
+    model = models[0]
+    assert model.camera_names == ['kermit000.jpg', 'kermit001.jpg']
+    assert model.focal.tolist() == [1484.81, 1490.2]
+    assert model.distortion.tolist() == [-0.0123, 1e-05]
+    assert model.rgb.tolist() == [[255, 128, 0], [1, 2, 3], [10, 11, 12]]
+    assert model.measurement_offsets.tolist() == [0, 2, 3, 6]
+    cameras, features, xy = model.point_measurements(2)
+    assert cameras.tolist() == [0, 1, 0]
+    assert features.tolist() == [1, 2, 3]
+    assert xy.tolist() == [[1, 1], [2, 2], [3, 3]]
+
+def test_round_trip(tmp_path):
+    model = vsfm_nvm.read_nvm(write_text(tmp_path, nvm_text))[0]
+    rng = np.random.default_rng(0)
+    # values edited in code must survive a write and read back exactly
+    model.xyz = rng.random(model.xyz.shape) * 100
+    model.measurement_xy = rng.random(model.measurement_xy.shape) - 0.5
+    model.ply = True
+    filename = str(tmp_path / 'written.nvm')
+    vsfm_nvm.write_nvm([model, model], filename)
+    models = vsfm_nvm.read_nvm(filename)
+    assert len(models) == 2
+    for read in models:
+        assert read.camera_names == model.camera_names
+        assert read.ply
+        for attribute in ('focal', 'quaternion', 'center', 'distortion', 'xyz', 'rgb', 'measurement_offsets',
+                          'measurement_camera', 'measurement_feature', 'measurement_xy'):
+            assert np.array_equal(getattr(read, attribute), getattr(model, attribute)), attribute
+
+@pytest.mark.parametrize('old, new', [
+    ("1.5 2.5 3.5 255 128 0 2 0 10 -12.5 30.25 1 22 -11 31", "1.5 2.5 3.5 255 128 0 3 0 10 -12.5 30.25 1 22 -11 31"),
+    ("-0.25 0.75 10 1 2 3 1 1 5 100 -200", "-0.25 0.75 10"),
+    ("-0.25 0.75 10 1 2 3 1 1 5 100 -200", "-0.25 0.75 10 1 2 3 1 1 5 100 -200 7"),
+    ("-0.25 0.75 10 1 2 3 1 1 5 100 -200", "-0.25 0.75 10 1 2 300 1 1 5 100 -200"),
+    ("-0.25 0.75 10 1 2 3 1 1 5 100 -200", "-0.25 0.75 10 1 2 3 1 1 5 abc -200"),
+    ("3\n1.5 2.5", "4\n1.5 2.5"),
+])
+def test_malformed_points(tmp_path, old, new):
+    assert old in nvm_text
+    with pytest.raises(ValueError):
+        vsfm_nvm.read_nvm(write_text(tmp_path, nvm_text.replace(old, new)))
+
+def test_truncated_cameras(tmp_path):
+    with pytest.raises(ValueError):
+        vsfm_nvm.read_nvm(write_text(tmp_path, nvm_text[0:nvm_text.index('kermit001.jpg')]))
@@ -0,0 +1,45 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+import vsfmpy
+
+def write_and_read(tmp_path, descriptors, **kwargs):
+    filename = str(tmp_path / 'features.sift')
+    positions = np.arange(2 * len(descriptors), dtype=np.float32).reshape(-1, 2)
+    vsfmpy.write_vsfm_sift_arrays(positions, np.ones(len(descriptors)), np.zeros(len(descriptors)), descriptors,
+                                  filename, **kwargs)
+    return vsfmpy.read_vsfm_sift_arrays(filename)[1]
+
+def test_float_descriptors_are_always_adapted(tmp_path):
+    rng = np.random.default_rng(0)
+    for descriptors in (rng.integers(0, 2, (20, 64)).astype(np.float32), rng.random((20, 64)).astype(np.float32)):
+        assert np.array_equal(write_and_read(tmp_path, descriptors), vsfmpy.adapt_descriptors(descriptors))
+
+def test_byte_descriptors(tmp_path):
+    rng = np.random.default_rng(1)
+    descriptors = rng.integers(0, 256, (20, 100)).astype(np.uint8)
+    written = write_and_read(tmp_path, descriptors)
+    assert np.array_equal(written[:, 0:100], descriptors)
+    assert not written[:, 100:].any()
+    # openCV's SIFT returns byte values as float32
+    sift = descriptors[:, 0:64].astype(np.float32)
+    assert np.array_equal(write_and_read(tmp_path, sift, adapt=False)[:, 0:64], sift)
+    with pytest.raises(ValueError):
+        write_and_read(tmp_path, sift + 0.5, adapt=False)
+
+def test_binary_descriptors(tmp_path):
+    orb = np.random.default_rng(2).integers(0, 256, (20, 32)).astype(np.uint8)
+    written = write_and_read(tmp_path, orb, binary=True)
+    assert np.array_equal(written, vsfmpy.adapt_descriptors(orb, binary=True))
+
+def test_descriptor_count_must_match(tmp_path):
+    with pytest.raises(ValueError):
+        vsfmpy.write_vsfm_sift_arrays(np.zeros((3, 2)), np.ones(3), np.zeros(3), np.zeros((2, 128), np.uint8),
+                                      str(tmp_path / 'features.sift'))
+
+def test_write_vsfm_sift_float_lists(tmp_path):
+    filename = str(tmp_path / 'features.sift')
+    rows = np.random.default_rng(3).random((5, 128))
+    keypoints = [vsfmpy.CompactKeyPoint(float(index), 2.0, 1.0, 0.0) for index in range(5)]
+    vsfmpy.write_vsfm_sift(keypoints, [list(row) for row in rows], filename)
+    assert np.array_equal(vsfmpy.read_vsfm_sift_arrays(filename)[1], vsfmpy.adapt_descriptors(rows))
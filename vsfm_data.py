@@ -8,10 +8,36 @@ vsfm_command_dict['menu_file']['open_multi_images']  returns the number for this
 
 from collections import OrderedDict
 import os
+import shutil
 default_path = r'C:\Program Files\VisualSFM_windows_cuda_64bit\VisualSFM.exe'
-if not os.path.exists(default_path):
-    from tkinter import filedialog
-    default_path = filedialog.askdirectory(title='Please select the VisualSFM.exe directory')
+vsfm_binary_env = 'VSFM_BINARY'  # environment variable holding the path to VisualSFM
+vsfm_config_file = os.path.join('~', '.vsfmpy')  # text file whose first line is the path to VisualSFM
+vsfm_binary_names = ['VisualSFM', 'VisualSFM.exe', 'vsfm']  # names searched for on the PATH
+
+def find_vsfm_binary():
+    """
+    Finds the VisualSFM binary. This is only done when VSFM is started, so importing vsfmpy never blocks.
+    Checked in order: the VSFM_BINARY environment variable, the first line of ~/.vsfmpy, the PATH, then default_path
+    :return: path of the VisualSFM binary
+    """
+    env_path = os.environ.get(vsfm_binary_env)
+    if env_path:
+        return env_path
+    try:
+        with open(os.path.expanduser(vsfm_config_file), 'r') as fileobj:
+            config_path = fileobj.readline().strip()
+        if config_path:
+            return config_path
+    except OSError:
+        pass
+    for binary_name in vsfm_binary_names:
+        found = shutil.which(binary_name)
+        if found is not None:
+            return found
+    if os.path.exists(default_path):
+        return default_path
+    raise FileNotFoundError("Could not find VisualSFM. Set the " + vsfm_binary_env + " environment variable, write its "
+                            "path in " + vsfm_config_file + " or add it to the PATH")
 
 
 file_menu = OrderedDict({33166	: 'open_multi_images',
@@ -151,3 +177,87 @@ vsfm_command_dict = dict()
 vsfm_command_dict['file'] = r_file_menu
 vsfm_command_dict['sfm'] = r_sfm_menu
 vsfm_command_dict['view'] = r_view_menu
+
+def command_identifier(tuple_command):
+    """
+    Builds a python identifier for each menu name in a command tuple. Submenus repeat their parent's name, e.g.
+    'menu_view_options' under 'view', so that part is dropped, '+' is spelled out and a leading digit gets an underscore
+    :param tuple_command: a command tuple, e.g ('view', 'menu_view_options', 'show_3+_points')
+    :return: tuple of identifiers, e.g ('view', 'options', 'show_3plus_points')
+    """
+    names = []
+    for i, key in enumerate(tuple_command):
+        if i > 0 and key.startswith('menu_' + tuple_command[i - 1] + '_'):
+            key = key[len('menu_' + tuple_command[i - 1] + '_'):]
+        key = key.replace('+', 'plus')
+        if key[0].isdigit():
+            key = '_' + key
+        names.append(key)
+    return tuple(names)
+
+def _compile_commands(command_dict, path=()):
+    """
+    Flattens vsfm_command_dict, checking that every command is an integer and that no number is used twice
+    :param command_dict: a (sub)menu dictionary
+    :param path: tuple of the menu names leading to this menu
+    :return: dictionary of {command tuple: number}
+    """
+    table = {}
+    for key, value in command_dict.items():
+        if '.' in key:
+            raise ValueError("Menu name " + key + " can not contain a '.'")
+        if isinstance(value, dict):
+            table.update(_compile_commands(value, path + (key,)))
+        elif isinstance(value, int):
+            table[path + (key,)] = value
+        else:
+            raise ValueError("Command " + str(path + (key,)) + " is not an integer: " + str(value))
+    if not path and len(set(table.values())) != len(table):
+        raise ValueError("Two commands share the same number")
+    return table
+
+class CommandMenu(object):
+    """
+    Attribute-style access to the command numbers of one menu, e.g. vsfm_commands.sfm.pairwise.compute_missing_match
+    """
+    def __init__(self, name):
+        self._name = name
+
+    def __repr__(self):
+        return 'CommandMenu(' + repr(self._name) + ')'
+
+def _build_menus(table):
+    """
+    Builds the CommandMenu tree from the flat command table
+    :param table: dictionary of {command tuple: number}
+    :return: the root CommandMenu
+    """
+    root = CommandMenu('')
+    for tuple_command, number in table.items():
+        menu = root
+        identifiers = command_identifier(tuple_command)
+        for depth, identifier in enumerate(identifiers[:-1]):
+            if not hasattr(menu, identifier):
+                setattr(menu, identifier, CommandMenu('.'.join(identifiers[0:depth + 1])))
+            menu = getattr(menu, identifier)
+        setattr(menu, identifiers[-1], number)
+    return root
+
+# Flat lookup from command tuples, and the same commands as dotted strings, to their numbers
+vsfm_command_table = _compile_commands(vsfm_command_dict)
+vsfm_command_table.update({'.'.join(tuple_command): number
+                           for tuple_command, number in list(vsfm_command_table.items())})
+vsfm_commands = _build_menus({key: number for key, number in vsfm_command_table.items() if isinstance(key, tuple)})
+
+def vsfm_command_number(command):
+    """
+    Looks up the number of a command
+    :param command: a command tuple e.g ('file', 'open_multi_images'), or dotted string e.g 'file.open_multi_images'
+    :return: the command number
+    """
+    if isinstance(command, list):
+        command = tuple(command)
+    try:
+        return vsfm_command_table[command]
+    except (KeyError, TypeError):
+        raise KeyError("Command '" + str(command) + "' not found")
@@ -0,0 +1,306 @@
+"""
+Readers and writers for the N-View Match (.nvm) files that VSFM saves its sparse reconstructions in, e.g. after
+('sfm', 'save_nview_match'). Written files can be loaded back with ('sfm', 'load_nview_match').
+
+The format is described at http://ccwu.me/vsfm/doc.html#nvm
+Each model is a list of cameras followed by a list of 3D points, and each point carries a variable length list of
+measurements (camera index, feature index, x, y). The measurements of every point are stored together in flat arrays
+with CSR-style offsets, so models with millions of points are held in a handful of numpy arrays.
+Usage:
+models = read_nvm('result.nvm')
+cameras, features, xy = models[0].point_measurements(0)
+write_nvm(models[0:1], 'first_model.nvm')
+"""
+
+import logging
+import warnings
+import numpy as np
+name = __name__
+loglevel = logging.INFO   # Adust the logging level here.
+logger = logging.getLogger(name)
+logger.setLevel(loglevel)
+console_handler = logging.StreamHandler()
+console_handler.setLevel(loglevel)
+formatter = logging.Formatter('%(name)s - %(levelname)s - %(message)s')
+console_handler.setFormatter(formatter)
+logger.addHandler(console_handler)
+
+nvm_version = 'NVM_V3'
+nvm_float_format = '%r'  # shortest text that reads back as the same float64, so edited models round trip exactly
+
+class NVMModel(object):
+    """
+    A single model from an NVM file.
+    Cameras are stored as camera_names, focal (C,), quaternion (C, 4) in WXYZ order, center (C, 3) and distortion (C,)
+    Points are stored as xyz (P, 3) and rgb (P, 3). The measurements of point i are the rows
+    measurement_offsets[i]:measurement_offsets[i+1] of measurement_camera, measurement_feature and measurement_xy
+    """
+    def __init__(self, camera_names, focal, quaternion, center, distortion, xyz, rgb, measurement_offsets,
+                 measurement_camera, measurement_feature, measurement_xy, fixed_calibration=None, ply=False):
+        """
+        Setup the attributes of the model
+        :param camera_names: list of image filenames, one per camera
+        :param focal: (C,) focal lengths
+        :param quaternion: (C, 4) camera rotations as WXYZ quaternions
+        :param center: (C, 3) camera centers
+        :param distortion: (C,) radial distortion coefficients
+        :param xyz: (P, 3) point positions
+        :param rgb: (P, 3) uint8 point colors
+        :param measurement_offsets: (P+1,) offsets of each point's measurements
+        :param measurement_camera: (K,) camera index of each measurement
+        :param measurement_feature: (K,) feature index of each measurement in its camera's .sift file
+        :param measurement_xy: (K, 2) image position of each measurement, relative to the image center
+        :param fixed_calibration: (fx, cx, fy, cy) if the file was saved with a fixed calibration
+        :param ply: True if VSFM saved a PLY file of the dense points for this model
+        """
+        self.camera_names = camera_names
+        self.focal = focal
+        self.quaternion = quaternion
+        self.center = center
+        self.distortion = distortion
+        self.xyz = xyz
+        self.rgb = rgb
+        self.measurement_offsets = measurement_offsets
+        self.measurement_camera = measurement_camera
+        self.measurement_feature = measurement_feature
+        self.measurement_xy = measurement_xy
+        self.fixed_calibration = fixed_calibration
+        self.ply = ply
+
+    @property
+    def ncameras(self):
+        return len(self.camera_names)
+
+    @property
+    def npoints(self):
+        return len(self.xyz)
+
+    def point_measurements(self, index):
+        """
+        Gets the measurements of one point
+        :param index: index of the point
+        :return: tuple of the camera indices, feature indices and (n, 2) image positions
+        """
+        begin, end = self.measurement_offsets[index], self.measurement_offsets[index + 1]
+        return (self.measurement_camera[begin:end], self.measurement_feature[begin:end],
+                self.measurement_xy[begin:end])
+
+def _next_line(data, pos):
+    """
+    Finds the next non-blank line in the file
+    :param data: bytes of the whole file
+    :param pos: position to start searching from
+    :return: tuple of the stripped line and the position after it. The line is None at the end of the file
+    """
+    while pos < len(data):
+        end = data.find(b'\n', pos)
+        if end == -1:
+            end = len(data)
+        line = data[pos:end].strip()
+        pos = end + 1
+        if line:
+            return line.decode('utf-8'), pos
+    return None, pos
+
+def _parse_cameras(data, pos, ncameras):
+    """
+    Parses the camera lines of a model
+    :param data: bytes of the whole file
+    :param pos: position of the first camera line
+    :param ncameras: number of camera lines
+    :return: tuple of the camera names, a (C, 10) array of camera values and the position after the cameras
+    """
+    names = []
+    values = np.empty((ncameras, 10), dtype=np.float64)
+    for i in range(ncameras):
+        line, pos = _next_line(data, pos)
+        if line is None:
+            raise ValueError("The nvm file ends after " + str(i) + " of " + str(ncameras) + " cameras")
+        fields = line.rsplit(None, 10)
+        if len(fields) != 11:
+            raise ValueError("Malformed camera line in nvm file: " + line)
+        names.append(fields[0])
+        values[i] = [float(field) for field in fields[1:11]]
+    return names, values, pos
+
+def _parse_numbers(text):
+    """
+    Parses whitespace separated numbers with numpy, without building a Python object for each of them
+    :param text: bytes of the numbers
+    :return: float64 array of the numbers
+    """
+    with warnings.catch_warnings():
+        # Older numpy versions only warn when a token can not be parsed, and return the numbers before it
+        warnings.simplefilter('error', DeprecationWarning)
+        try:
+            return np.fromstring(text, dtype=np.float64, sep=' ')
+        except DeprecationWarning as error:
+            raise ValueError(str(error))
+
+def _parse_points(data, pos, npoints):
+    """
+    Parses the point lines of a model with a single numpy conversion
+    :param data: bytes of the whole file
+    :param pos: position of the first point line
+    :param npoints: number of point lines
+    :return: tuple of xyz, rgb, measurement offsets, cameras, features, xy and the position after the points
+    """
+    chars = np.frombuffer(data, dtype=np.uint8, count=len(data) - pos, offset=pos)
+    line_ends = np.flatnonzero(chars == ord('\n'))[0:npoints]
+    if len(line_ends) < npoints and np.any(chars[line_ends[-1] + 1 if len(line_ends) else 0:] > ord(' ')):
+        line_ends = np.append(line_ends, len(chars))
+    if len(line_ends) < npoints:
+        raise ValueError("The nvm file ends after " + str(len(line_ends)) + " of " + str(npoints) + " points")
+    end = pos + line_ends[-1] + 1 if npoints else pos
+    chars = chars[0:end - pos]
+    # Count the fields of each line from the whitespace to non-whitespace transitions, one byte per character
+    is_field = chars > ord(' ')
+    starts = np.empty_like(is_field)
+    starts[0:1] = is_field[0:1]
+    np.greater(is_field[1:], is_field[:-1], out=starts[1:])
+    del is_field
+    line_begins = np.zeros(npoints, dtype=np.int64)
+    line_begins[1:] = line_ends[:-1] + 1
+    field_counts = np.add.reduceat(starts, line_begins, dtype=np.int64) if npoints else line_begins
+    del starts
+    nmeasurements = (field_counts - 7) // 4
+    malformed = (field_counts < 7) | (field_counts != 7 + 4 * nmeasurements)
+    if malformed.any():
+        raise ValueError("Malformed point line " + str(np.argmax(malformed)) + " in nvm file, it has " +
+                         str(field_counts[np.argmax(malformed)]) + " fields")
+    values = _parse_numbers(data[pos:end])
+    if len(values) != field_counts.sum():
+        raise ValueError("Could not parse the point block of the nvm file")
+    record_starts = np.zeros(npoints, dtype=np.int64)
+    np.cumsum(field_counts[:-1], out=record_starts[1:])
+    declared = values[record_starts + 6]
+    if np.any(declared != nmeasurements):
+        index = np.argmax(declared != nmeasurements)
+        raise ValueError("Point " + str(index) + " of the nvm file declares " + '%g' % declared[index] +
+                         " measurements but has " + str(nmeasurements[index]))
+    xyz = values[record_starts[:, None] + np.arange(3)]
+    rgb = values[record_starts[:, None] + np.arange(3, 6)]
+    if np.any((rgb < 0) | (rgb > 255) | (rgb != np.rint(rgb))):
+        raise ValueError("Point colors in the nvm file must be integers from 0 to 255")
+    rgb = rgb.astype(np.uint8)
+    offsets = np.zeros(npoints + 1, dtype=np.int64)
+    np.cumsum(nmeasurements, out=offsets[1:])
+    # index of each measurement within its point, then its position in values
+    within = np.arange(offsets[-1]) - np.repeat(offsets[:-1], nmeasurements)
+    measurement_starts = np.repeat(record_starts + 7, nmeasurements) + 4 * within
+    cameras = values[measurement_starts].astype(np.int32)
+    features = values[measurement_starts + 1].astype(np.int32)
+    xy = values[measurement_starts[:, None] + np.arange(2, 4)]
+    return xyz, rgb, offsets, cameras, features, xy, end
+
+def read_nvm(filename):
+    """
+    Reads all the models in an NVM_V3 file
+    :param filename: a vsfm generated .nvm file
+    :return: list of NVMModel objects
+    """
+    logger.info("Now reading nvm file " + filename)
+    with open(filename, 'rb') as fileobj:
+        data = fileobj.read()
+    line, pos = _next_line(data, 0)
+    if line is None or line.split()[0] != nvm_version:
+        raise ValueError(filename + " is not an " + nvm_version + " file")
+    header = line.split()
+    fixed_calibration = None
+    if len(header) >= 6 and header[1] == 'FixedK':
+        fixed_calibration = tuple(float(val) for val in header[2:6])
+    models = []
+    line, pos = _next_line(data, pos)
+    while line is not None and not line.startswith('#'):
+        ncameras = int(line)
+        if ncameras == 0:
+            break
+        names, cameras, pos = _parse_cameras(data, pos, ncameras)
+        line, pos = _next_line(data, pos)
+        if line is None:
+            raise ValueError("The nvm file ends before the point count of model " + str(len(models)))
+        npoints = int(line)
+        xyz, rgb, offsets, point_cameras, features, xy, pos = _parse_points(data, pos, npoints)
+        models.append(NVMModel(names, cameras[:, 0], cameras[:, 1:5], cameras[:, 5:8], cameras[:, 8], xyz, rgb,
+                               offsets, point_cameras, features, xy, fixed_calibration))
+        logger.debug("Model " + str(len(models)) + " has " + str(ncameras) + " cameras and " + str(npoints) +
+                     " points")
+        line, pos = _next_line(data, pos)
+    # The last part of the file lists the models that have an associated PLY file
+    ply_fields = []
+    while line is not None:
+        line, pos = _next_line(data, pos)
+        if line is not None and not line.startswith('#'):
+            ply_fields.extend(int(field) for field in line.split())
+    for model_index in ply_fields[1:]:
+        if model_index < len(models):
+            models[model_index].ply = True
+    logger.info(str(len(models)) + " models read from " + filename)
+    return models
+
+def _format_cameras(model):
+    """
+    Formats the camera lines of a model
+    :param model: NVMModel to format
+    :return: string of the camera lines
+    """
+    values = np.column_stack([model.focal, model.quaternion, model.center, model.distortion]).tolist()
+    camera_format = ' '.join([nvm_float_format] * 9) + ' 0\n'
+    return ''.join([name + '\t' + camera_format % tuple(row) for name, row in zip(model.camera_names, values)])
+
+def _iter_point_text(model, chunk_size):
+    """
+    Formats the point lines of a model in chunks
+    :param model: NVMModel to format
+    :param chunk_size: number of points in each chunk
+    :return: generator of strings each holding up to chunk_size point lines
+    """
+    offsets = model.measurement_offsets.tolist()
+    point_format = ' '.join([nvm_float_format] * 3) + ' %d %d %d %d'
+    measurement_format = ' %d %d ' + nvm_float_format + ' ' + nvm_float_format
+    for begin in range(0, model.npoints, chunk_size):
+        end = min(begin + chunk_size, model.npoints)
+        first, last = offsets[begin], offsets[end]
+        measurements = [measurement_format % values for values in
+                        zip(model.measurement_camera[first:last].tolist(),
+                            model.measurement_feature[first:last].tolist(),
+                            model.measurement_xy[first:last, 0].tolist(),
+                            model.measurement_xy[first:last, 1].tolist())]
+        xyz = model.xyz[begin:end].tolist()
+        rgb = model.rgb[begin:end].tolist()
+        lines = []
+        for i in range(begin, end):
+            local = i - begin
+            lines.append(point_format % (*xyz[local], *rgb[local], offsets[i + 1] - offsets[i]))
+            lines.extend(measurements[offsets[i] - first:offsets[i + 1] - first])
+            lines.append('\n')
+        yield ''.join(lines)
+
+def write_nvm(models, filename, chunk_size=65536, buffer_size=1 << 20):
+    """
+    Writes models to an NVM_V3 file which can be loaded by VSFM
+    :param models: list of NVMModel objects, all saved in the same file
+    :param filename: Output path of the .nvm file
+    :param chunk_size: number of points formatted before each write
+    :param buffer_size: size in bytes of the file write buffer
+    :return: None
+    """
+    logger.info("Now writing " + str(len(models)) + " models to nvm file " + filename)
+    header = nvm_version
+    if models and models[0].fixed_calibration is not None:
+        header += ' FixedK ' + ' '.join([nvm_float_format % float(val) for val in models[0].fixed_calibration])
+    with open(filename, 'w', buffering=buffer_size) as fileobj:
+        fileobj.write(header + '\n\n')
+        for model in models:
+            fileobj.write(str(model.ncameras) + '\n')
+            fileobj.write(_format_cameras(model))
+            fileobj.write(str(model.npoints) + '\n')
+            for text in _iter_point_text(model, chunk_size):
+                fileobj.write(text)
+            fileobj.write('\n')
+        ply_models = [str(index) for index, model in enumerate(models) if model.ply]
+        fileobj.write('0\n\n'
+                      '#the last part of NVM file points to the PLY files\n'
+                      '#the first number is the number of associated PLY files\n'
+                      '#each following number gives a model-index that has PLY\n')
+        fileobj.write(' '.join([str(len(ply_models))] + ply_models) + '\n')
@@ -20,8 +20,21 @@ import struct
 import time
 import subprocess
 import socket
+import queue
+import threading
+import contextlib
 import os
+import mmap
+import hashlib
+import tempfile
+import selectors
+import weakref
+import json
+import itertools
+import collections
 import logging
+import warnings
+from concurrent.futures import ThreadPoolExecutor, as_completed
 name = __name__
 loglevel = logging.INFO   # Adust the logging level here.
 logger = logging.getLogger(name)
@@ -33,117 +46,646 @@ console_handler.setFormatter(formatter)
 logger.addHandler(console_handler)
 
 try:
-    from vsfm_data import vsfm_command_dict, default_path
+    from vsfm_data import vsfm_command_dict, vsfm_command_table, vsfm_commands, vsfm_command_number, \
+        command_identifier, find_vsfm_binary
 except ImportError:
     try:
-        from .vsfm_data import vsfm_command_dict, default_path
+        from .vsfm_data import vsfm_command_dict, vsfm_command_table, vsfm_commands, vsfm_command_number, \
+            command_identifier, find_vsfm_binary
     except ImportError:
         logger.error("Could not import from vsfm_data")
-try:
-    from cv2 import KeyPoint
-    from numpy import ndarray, pi
-    tau = 2 * pi
-    opencv=True
-except:
-    logger.error("Could not import openCV and numpy.")
-    tau = 2 * 3.141592653589793
-    class KeyPoint(object):
-        """
-        This class is defined only if openCV is missing. These objects will serve as placeholders for the keypoint class
-        that is normally used by openCV.
-        """
-        def __init__(self, x, y, size, angle=-1, response=0, octave=0, class_id=-1):
-            """
-            Setup some attributes for the class
-            :param x: x pixel position of the keypoint
-            :param y: y pixel position of the keypoint
-            :param size: relative size in pixels of the keypoint
-            :param angle: its relative angle
-            :param response: carry over from openCV
-            :param octave: On a pyramid's scale how is it with respect to the rest
-            :param class_id: carry over from openCV
-            """
-            self.x = x
-            self.y = y
-            self.pt = (x, y)
-            self.size = size
-            self.angle = angle
-            self.response = response
-            self.octave = octave
-            self.class_id = class_id
-    opencv = False
-
-def read_vsfm_sift(filename):
+tau = 2 * 3.141592653589793
+
+class CompactKeyPoint(object):
+    """
+    A small keypoint used when openCV is missing. The attributes are stored in __slots__ rather than a __dict__, and
+    pt is computed from x and y, so each keypoint costs a fraction of the memory of a regular object.
+    pt, size and angle are used the same way as on openCV's KeyPoint.
+    """
+    __slots__ = ('x', 'y', 'size', 'angle', 'response', 'octave', 'class_id')
+
+    def __init__(self, x, y, size, angle=-1, response=0, octave=0, class_id=-1):
+        """
+        Setup some attributes for the class
+        :param x: x pixel position of the keypoint
+        :param y: y pixel position of the keypoint
+        :param size: relative size in pixels of the keypoint
+        :param angle: its relative angle
+        :param response: carry over from openCV
+        :param octave: On a pyramid's scale how is it with respect to the rest
+        :param class_id: carry over from openCV
+        """
+        self.x = x
+        self.y = y
+        self.size = size
+        self.angle = angle
+        self.response = response
+        self.octave = octave
+        self.class_id = class_id
+
+    @property
+    def pt(self):
+        return self.x, self.y
+
+    def __repr__(self):
+        return 'CompactKeyPoint(' + str(self.x) + ', ' + str(self.y) + ', ' + str(self.size) + ', ' + \
+               str(self.angle) + ')'
+
+# openCV and numpy are only imported the first time a function needs them, so importing this module stays cheap
+_keypoint_class = None
+np = None
+
+def _get_keypoint_class():
+    """
+    Imports openCV's KeyPoint class on first use, falling back to CompactKeyPoint if openCV is missing
+    :return: the KeyPoint class
+    """
+    global _keypoint_class
+    if _keypoint_class is None:
+        try:
+            from cv2 import KeyPoint as _keypoint_class
+        except ImportError:
+            logger.debug("Could not import openCV, using placeholder keypoints.")
+            _keypoint_class = CompactKeyPoint
+    return _keypoint_class
+
+def __getattr__(attribute):
+    """
+    Resolves the KeyPoint and opencv module attributes lazily
+    """
+    if attribute == 'KeyPoint':
+        return _get_keypoint_class()
+    if attribute == 'opencv':
+        return _get_keypoint_class() is not CompactKeyPoint
+    raise AttributeError("module " + repr(__name__) + " has no attribute " + repr(attribute))
+
+# .sift files are little-endian with fixed width fields whatever platform wrote them, so the formats are explicit
+# rather than native, where 'L' is 8 bytes on 64-bit Linux.
+sift_header_struct = struct.Struct('<8s3I')  # 'method, version, # features, the number 5 and the number 128.
+sift_loc_struct = struct.Struct('<2f3Bx2f')  # x, y, color rgb, unused alpha, scale, orientation in radians
+sift_desc_struct = struct.Struct('<128B')  # description vector as chars for some reason
+sift_eof_marker = b'\xFFEOF'
+sift_loc_dtype = None
+
+def _require_numpy():
+    """
+    Imports numpy on first use, raising an ImportError if numpy is missing. Used by the array based functions
+    :return: the numpy module
+    """
+    global np, sift_loc_dtype
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            raise ImportError("numpy is required for this function")
+        # Same layout as sift_loc_struct, the padding byte after the color is the unused alpha channel
+        sift_loc_dtype = numpy.dtype({'names': ['x', 'y', 'color', 'size', 'angle'],
+                                      'formats': ['<f4', '<f4', ('u1', 3), '<f4', '<f4'],
+                                      'offsets': [0, 4, 8, 12, 16],
+                                      'itemsize': sift_loc_struct.size})
+        np = numpy
+    return np
+
+def _read_sift_header(fileobj):
+    """
+    Reads the header of an open .sift file
+    :param fileobj: binary file object positioned at the start of the file
+    :return: tuple of the sift type string, number of features, location size and descriptor size
+    """
+    return _unpack_sift_header(fileobj.read(sift_header_struct.size))
+
+def _unpack_sift_header(buffer):
+    """
+    Unpacks a .sift header from the start of a bytes-like buffer
+    :param buffer: bytes, or a memory mapped file
+    :return: tuple of the sift type string, number of features, location size and descriptor size
+    """
+    if len(buffer) < sift_header_struct.size:
+        raise ValueError("File is too short to be a .sift file")
+    sift_type, nfeatures, loc_dim, desc_dim = sift_header_struct.unpack_from(buffer)
+    sift_type = sift_type.decode('utf-8', 'replace')
+    logger.debug("Sift type is: " + sift_type)
+    if not sift_type.startswith('SIFT') or loc_dim != 5 or desc_dim != sift_desc_struct.size:
+        raise ValueError("Not a vsfm .sift file, header is " + str((sift_type, nfeatures, loc_dim, desc_dim)))
+    return sift_type, nfeatures, loc_dim, desc_dim
+
+def _check_sift_eof(marker, filename):
+    """
+    Checks the marker that ends every .sift file, so truncated or misread files are not silently accepted
+    :param marker: the bytes read after the descriptor block
+    :param filename: filename for the error message
+    """
+    if bytes(marker[0:len(sift_eof_marker)]) != sift_eof_marker:
+        raise ValueError("Missing end of file marker in " + filename + ", the file is truncated or corrupt")
+
+def _pack_sift_header(nfeatures):
+    """
+    Packs the header of a version 4 .sift file
+    :param nfeatures: number of features in the file
+    :return: header bytes
+    """
+    return sift_header_struct.pack(b'SIFTV4.0', nfeatures, 5, sift_desc_struct.size)
+
+def read_vsfm_sift_header(filename):
+    """
+    Reads only the header of a '.sift' file, useful when just the feature counts are needed
+    :param filename: a vsfm generated .sift file
+    :return: tuple of the sift type string (e.g. 'SIFTV4.0') and the number of features
+    """
+    with open(filename, 'rb') as fileobj:
+        return _read_sift_header(fileobj)[0:2]
+
+def index_sift_dir(sift_path, index_name='sift_index.json', workers=None):
+    """
+    Builds an index of the feature counts of every '.sift' file in a directory. The counts are cached in a sidecar
+    file alongside the size and modification time of each file, so only new or changed files have their headers
+    read on a re-scan.
+    :param sift_path: directory containing .sift files
+    :param index_name: filename of the sidecar index, saved in sift_path
+    :param workers: number of threads used to read the headers, defaults to the ThreadPoolExecutor default
+    :return: dictionary of {filename: {'sift_type', 'nfeatures', 'size', 'mtime'}}
+    """
+    index_file = os.path.join(sift_path, index_name)
+    try:
+        with open(index_file, 'r') as fileobj:
+            cached = json.load(fileobj)
+    except (OSError, ValueError):
+        cached = {}
+    index = {}
+    stale = []
+    for entry in os.scandir(sift_path):
+        if not entry.name.endswith('.sift') or not entry.is_file():
+            continue
+        stat = entry.stat()
+        previous = cached.get(entry.name)
+        if previous is not None and previous['size'] == stat.st_size and previous['mtime'] == stat.st_mtime:
+            index[entry.name] = previous
+        else:
+            index[entry.name] = {'size': stat.st_size, 'mtime': stat.st_mtime}
+            stale.append(entry.name)
+    logger.info(str(len(index)) + " sift files found in " + sift_path + ", " + str(len(stale)) + " need scanning")
+    if stale:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            headers = executor.map(read_vsfm_sift_header, [os.path.join(sift_path, name) for name in stale])
+            for name, (sift_type, nfeatures) in zip(stale, headers):
+                index[name]['sift_type'] = sift_type
+                index[name]['nfeatures'] = nfeatures
+    if stale or len(index) != len(cached):
+        with open(index_file, 'w') as fileobj:
+            json.dump(index, fileobj)
+    return index
+
+def read_vsfm_sift(filename, keypoint_set=False):
     """
     This function reads in a vsfm-generated '.sift' file and returns a keypoint list and their descriptions
     :param filename: a vsfm generated .sift file
+    :param keypoint_set: if True, read with numpy and return a KeypointSet and an (N, 128) uint8 descriptor array
     :return: tuple containing a keypoint list, and descriptions for those keypoints
     """
+    if keypoint_set:
+        locations, descriptors = read_vsfm_sift_arrays(filename)
+        return KeypointSet.from_locations(locations), descriptors
     logger.info("Now reading vsfm sift binary file " + filename)
     with open(filename, 'rb') as fileobj:
-        header_format = 'c'*8 + 'L'*3 # 'method, version, # features, the number 5 and the number 128. No idea why.
-        loc_format = 'ffBBBff'  # x, y, color rgb, scale, orientation in radians
-        desc_format = 'B'*128  # description vector as chars for some reason
-        header_bin = fileobj.read(struct.calcsize('s'*8 + 'L'*3))
-        header= struct.unpack_from(header_format, header_bin)
-        sift_type = ''.join([ch.decode('utf-8') for ch in header[0:8]])
-        logger.debug("Sift type is: " + sift_type)
-        nfeatures = header[8]
+        sift_type, nfeatures = _read_sift_header(fileobj)[0:2]
         logger.debug("Detecting " + str(nfeatures) + " features in this file.")
-        keypoints = []
-        descriptions = []
-        for i in range(nfeatures):
-            loc_bin = fileobj.read(4*5)
-            location = struct.unpack_from(loc_format, loc_bin)
-            keypoints.append(location)
+        loc_bin = fileobj.read(nfeatures * sift_loc_struct.size)
+        desc_bin = fileobj.read(nfeatures * sift_desc_struct.size)
+        _check_sift_eof(fileobj.read(len(sift_eof_marker)), filename)
+        keypoints = list(sift_loc_struct.iter_unpack(loc_bin))
         logger.debug(str(len(keypoints)) + " keypoints found")
-
-        for _ in range(nfeatures):
-            desc_bin = fileobj.read(struct.calcsize(desc_format))
-            desc = struct.unpack_from(desc_format, desc_bin)
-            descriptions.append(desc)
-        logger.debug(str(len(descriptions)) + " descriptions found, two examples:")
-        buffer = fileobj.read()
-        logger.debug("The rest of the buffer is:" + str(buffer))
-        kp_list = [KeyPoint(kp[0], kp[1], kp[5], kp[6]*360/tau) for kp in keypoints]
+        descriptions = list(sift_desc_struct.iter_unpack(desc_bin))
+        logger.debug(str(len(descriptions)) + " descriptions found")
+        kp_list = [_get_keypoint_class()(kp[0], kp[1], kp[5], kp[6]*360/tau) for kp in keypoints]
         return kp_list, descriptions
 
-def write_vsfm_sift(keypoints, descriptors=None, filename=None):
+def read_vsfm_sift_arrays(filename, keypoints=False):
+    """
+    Reads a vsfm-generated '.sift' file into numpy arrays. Much faster than ::read_vsfm_sift for large files since
+    the location and descriptor blocks are each decoded in a single call.
+    :param filename: a vsfm generated .sift file
+    :param keypoints: if True, also build a list of KeyPoint objects from the locations
+    :return: tuple of a structured location array (x, y, color, size, angle) and an (N, 128) uint8 descriptor array.
+    If keypoints is True, the KeyPoint list is returned as a third element
+    """
+    _require_numpy()
+    logger.info("Now reading vsfm sift binary file " + filename)
+    with open(filename, 'rb') as fileobj:
+        sift_type, nfeatures = _read_sift_header(fileobj)[0:2]
+        logger.debug("Detecting " + str(nfeatures) + " features in this file.")
+        desc_size = sift_desc_struct.size
+        loc_bin = fileobj.read(nfeatures * sift_loc_dtype.itemsize)
+        desc_bin = fileobj.read(nfeatures * desc_size)
+        _check_sift_eof(fileobj.read(len(sift_eof_marker)), filename)
+        locations = np.frombuffer(loc_bin, dtype=sift_loc_dtype, count=nfeatures)
+        descriptors = np.frombuffer(desc_bin, dtype=np.uint8, count=nfeatures * desc_size).reshape(nfeatures, desc_size)
+    if keypoints:
+        return locations, descriptors, sift_locations_to_keypoints(locations)
+    return locations, descriptors
+
+def iter_vsfm_sift_descriptors(filename, chunk_size=4096):
+    """
+    Reads the descriptors of a '.sift' file in blocks, so that files with very many features can be processed with
+    bounded memory
+    :param filename: a vsfm generated .sift file
+    :param chunk_size: maximum number of descriptor rows in each block
+    :return: generator of (n, 128) uint8 arrays, the last block may be shorter
+    """
+    if chunk_size <= 0:
+        raise ValueError("chunk_size must be positive, got " + str(chunk_size))
+    _require_numpy()
+    return _iter_sift_descriptor_blocks(filename, chunk_size)
+
+def _iter_sift_descriptor_blocks(filename, chunk_size):
+    """
+    Generator behind ::iter_vsfm_sift_descriptors, split out so bad arguments are reported when it is called
+    """
+    with open(filename, 'rb') as fileobj:
+        nfeatures = _read_sift_header(fileobj)[1]
+        desc_size = sift_desc_struct.size
+        fileobj.seek(nfeatures * sift_loc_dtype.itemsize, os.SEEK_CUR)
+        remaining = nfeatures
+        while remaining > 0:
+            rows = min(chunk_size, remaining)
+            block = np.empty((rows, desc_size), dtype=np.uint8)
+            if fileobj.readinto(block) != block.nbytes:
+                raise ValueError("Unexpected end of file in descriptors of " + filename + ", the file is truncated or "
+                                 "corrupt")
+            remaining -= rows
+            yield block
+        _check_sift_eof(fileobj.read(len(sift_eof_marker)), filename)
+
+def sift_locations_to_keypoints(locations):
+    """
+    Builds KeyPoint objects from a structured location array, as returned by ::read_vsfm_sift_arrays
+    :param locations: structured array with x, y, size and angle (radians) fields
+    :return: list of KeyPoint objects, with angles in degrees
+    """
+    angles = locations['angle'] * 360 / tau
+    keypoint_class = _get_keypoint_class()
+    return [keypoint_class(float(x), float(y), float(size), float(angle))
+            for x, y, size, angle in zip(locations['x'], locations['y'], locations['size'], angles)]
+
+class KeypointSet(object):
+    """
+    Keypoints stored as a struct of arrays: an (N, 2) array of positions and (N,) arrays of sizes and angles, angles
+    in degrees as used by openCV, and optionally an (N, 3) uint8 array of RGB colors. Indexing with an integer gives a
+    CompactKeyPoint, and indexing with a slice or an index array gives a new KeypointSet, so a set can be used in
+    place of a list of keypoints.
+    """
+    def __init__(self, pt, size, angle, color=None):
+        """
+        :param pt: (N, 2) array of x, y pixel positions
+        :param size: (N,) array of keypoint sizes
+        :param angle: (N,) array of keypoint angles in degrees
+        :param color: (N, 3) uint8 array of RGB colors, if known
+        """
+        self.pt = pt
+        self.size = size
+        self.angle = angle
+        self.color = color
+
+    @classmethod
+    def from_locations(cls, locations):
+        """
+        Builds a set from a structured location array, as returned by ::read_vsfm_sift_arrays
+        :param locations: structured array with x, y, size and angle (radians) fields
+        :return: KeypointSet
+        """
+        np = _require_numpy()
+        return cls(np.column_stack([locations['x'], locations['y']]), locations['size'].copy(),
+                   locations['angle'] * 360 / tau, locations['color'].copy())
+
+    def __len__(self):
+        return len(self.size)
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, _require_numpy().integer)):
+            return CompactKeyPoint(float(self.pt[index, 0]), float(self.pt[index, 1]), float(self.size[index]),
+                                   float(self.angle[index]))
+        color = None if self.color is None else self.color[index]
+        return KeypointSet(self.pt[index], self.size[index], self.angle[index], color)
+
+    def __iter__(self):
+        for (x, y), size, angle in zip(self.pt.tolist(), self.size.tolist(), self.angle.tolist()):
+            yield CompactKeyPoint(x, y, size, angle)
+
+    def to_keypoints(self):
+        """
+        Builds a list of keypoint objects, openCV's KeyPoint if it is installed
+        :return: list of keypoints
+        """
+        keypoint_class = _get_keypoint_class()
+        return [keypoint_class(x, y, size, angle) for (x, y), size, angle in
+                zip(self.pt.tolist(), self.size.tolist(), self.angle.tolist())]
+
+def _sift_executor(workers, processes):
+    """
+    Creates the executor used by the batch readers
+    :param workers: maximum number of workers, None uses the executor's default
+    :param processes: True for a process pool, False for a thread pool
+    :return: an Executor
+    """
+    if processes:
+        from concurrent.futures import ProcessPoolExecutor
+        return ProcessPoolExecutor(max_workers=workers)
+    return ThreadPoolExecutor(max_workers=workers)
+
+def read_vsfm_sift_many(filenames, workers=None, processes=True, reader=None):
+    """
+    Reads many '.sift' files in parallel
+    :param filenames: list of vsfm generated .sift files
+    :param workers: number of workers, defaults to the number of cores
+    :param processes: decode in a process pool if True, otherwise in a thread pool
+    :param reader: function used to read each file, defaults to ::read_vsfm_sift_arrays. Must be picklable when
+    processes is True
+    :return: list of the reader's results, in the same order as filenames
+    """
+    if reader is None:
+        reader = read_vsfm_sift_arrays
+    logger.info("Reading " + str(len(filenames)) + " sift files")
+    with _sift_executor(workers, processes) as executor:
+        return list(executor.map(reader, filenames))
+
+def iter_vsfm_sift_many(filenames, workers=None, processes=True, reader=None):
+    """
+    Reads many '.sift' files in parallel, yielding each one as soon as it has been decoded
+    :param filenames: list of vsfm generated .sift files
+    :param workers: number of workers, defaults to the number of cores
+    :param processes: decode in a process pool if True, otherwise in a thread pool
+    :param reader: function used to read each file, defaults to ::read_vsfm_sift_arrays
+    :return: generator of (filename, result) tuples in completion order
+    """
+    if reader is None:
+        reader = read_vsfm_sift_arrays
+    with _sift_executor(workers, processes) as executor:
+        futures = {executor.submit(reader, filename): filename for filename in filenames}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+class SiftFile(object):
+    """
+    Memory mapped, read-only access to a vsfm '.sift' file. Opening the file only parses the header, the location and
+    descriptor arrays are views over the mapped file so pages are only read from disk when they are touched.
+    Usage:
+    with SiftFile('image.sift') as sift:
+        first_descriptors = sift.descriptors[0:10]
+    """
+    def __init__(self, filename):
+        """
+        Maps the file and builds the array views
+        :param filename: a vsfm generated .sift file
+        """
+        _require_numpy()
+        self.filename = filename
+        self._fileobj = open(filename, 'rb')
+        try:
+            self._mmap = mmap.mmap(self._fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._fileobj.close()
+            raise
+        loc_offset = sift_header_struct.size
+        desc_size = sift_desc_struct.size
+        try:
+            self.sift_type, self.nfeatures = _unpack_sift_header(self._mmap)[0:2]
+            desc_offset = loc_offset + self.nfeatures * sift_loc_dtype.itemsize
+            eof_offset = desc_offset + self.nfeatures * desc_size
+            _check_sift_eof(self._mmap[eof_offset:eof_offset + len(sift_eof_marker)], filename)
+        except ValueError:
+            self._mmap.close()
+            self._fileobj.close()
+            raise
+        self.locations = np.frombuffer(self._mmap, dtype=sift_loc_dtype, count=self.nfeatures, offset=loc_offset)
+        self.descriptors = np.frombuffer(self._mmap, dtype=np.uint8, count=self.nfeatures * desc_size,
+                                         offset=desc_offset).reshape(self.nfeatures, desc_size)
+        logger.debug("Mapped " + str(self.nfeatures) + " features from " + filename)
+
+    def __len__(self):
+        return self.nfeatures
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def keypoints(self):
+        """
+        Builds KeyPoint objects for every feature in the file
+        :return: list of KeyPoint objects
+        """
+        return sift_locations_to_keypoints(self.locations)
+
+    def close(self):
+        """
+        Releases the mapping and the file. Any arrays sliced from this object must not be used afterwards;
+        copy them first if they are needed.
+        """
+        self.locations = None
+        self.descriptors = None
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                logger.debug("Views of " + self.filename + " are still in use, the mapping is freed with them")
+            self._mmap = None
+        self._fileobj.close()
+
+def write_vsfm_sift(keypoints, descriptors=None, filename=None, adapt=None, binary=False):
     """
     This function writes the keypoints and descriptors to a VSFM-readable '.sift' file.
     Note that while it writes .sift files, there's no need that the SIFT algorithm be used to generate keypoints
     :param keypoints: List of Keypoint objects
-    :param descriptors: List of vectors which are each descriptors of those keypoints. Used for matching
+    :param descriptors: List of vectors which are each descriptors of those keypoints. Used for matching. Rows of a
+    list are padded or cut to 128 values. Float descriptors are converted with ::adapt_descriptors, integer ones are
+    written as bytes
     :param filename: Filename to save this file to. If not provided, will be 'features.sift' in the same path
+    :param adapt: True to always convert the descriptors with ::adapt_descriptors, False to write them as bytes,
+    e.g. for the float32 descriptors of openCV's SIFT which already hold byte values
+    :param binary: True for packed binary descriptors such as ORB's, see ::adapt_descriptors
     :return:
     """
+    np = _require_numpy()
     if filename is None:
         filename = 'features.sift'
+    desc_size = sift_desc_struct.size
+    if type(descriptors).__name__ != 'ndarray' and not binary:
+        rows = [list(desc[0:desc_size]) + [0] * (desc_size - len(desc)) for desc in descriptors]
+        descriptors = np.asarray(rows).reshape(len(rows), desc_size)
+    descriptors = _sift_descriptor_block(np.asarray(descriptors), adapt, binary)
+    if len(descriptors) != len(keypoints):
+        raise ValueError(str(len(descriptors)) + " descriptors given for " + str(len(keypoints)) + " keypoints")
     with open(filename, 'wb') as fileobj:
         logger.debug("Now writing vsfm binary 'sift' file for features")
-        # format strings for the binary daata
-        header_format = 'c'*8+'L'*3
-        loc_format = 'ffBBBff'
-        desc_format = 'B'*128
         #Header
-        header_bin = struct.pack(header_format, *[ch.encode('utf-8') for ch in 'SIFTV4.0'], len(keypoints), 5, 128)
+        header_bin = _pack_sift_header(len(keypoints))
         fileobj.write(header_bin)
         # Now for features
         for kp in keypoints:
-            loc_bin = struct.pack(loc_format, kp.pt[0], kp.pt[1], *[0, 0, 0], kp.size, kp.angle*tau/360)
+            loc_bin = sift_loc_struct.pack(kp.pt[0], kp.pt[1], *[0, 0, 0], kp.size, kp.angle*tau/360)
             fileobj.write(loc_bin)
-        for desc in descriptors:
-            if type(desc) is list or (opencv and type(desc) is ndarray):
-                desc = [int(val) for val in desc]
-            if len(desc) < 128:
-                desc += [0]*(128-len(desc))
-            elif len(desc) > 128:
-                desc = desc[0:128]
-            desc_bin = struct.pack(desc_format, *desc)
-            fileobj.write(desc_bin)
-        fileobj.write(b'\xFFEOF')
+        fileobj.write(np.ascontiguousarray(descriptors))
+        fileobj.write(sift_eof_marker)
+    return True
+
+def fit_descriptor_pca(samples, dims=128):
+    """
+    Fits a PCA projection for descriptors wider than the 128 values a .sift file holds. Fit it once on descriptors
+    sampled from all of the images, so every image is projected the same way and stays matchable.
+    :param samples: (N, D) array of descriptors, binary descriptors should be unpacked first with np.unpackbits
+    :param dims: number of dimensions to keep
+    :return: tuple of the (D,) mean and the (dims, D) projection matrix
+    """
+    np = _require_numpy()
+    samples = np.asarray(samples, dtype=np.float64)
+    mean = samples.mean(axis=0)
+    centered = samples - mean
+    covariance = centered.T @ centered / max(1, len(samples) - 1)
+    eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+    components = eigenvectors[:, ::-1][:, 0:dims].T
+    return mean.astype(np.float32), components.astype(np.float32)
+
+def adapt_descriptors(descriptors, binary=False, pca=None, signed=None):
+    """
+    Converts descriptors from any detector to the (N, 128) uint8 descriptors VSFM expects, on the whole matrix at once.
+    Binary descriptors (e.g. ORB, AKAZE) are unpacked to one value per bit, and without a pca the bits are folded to
+    128 values by summing runs of adjacent bits (pairs for ORB's 256 bits). Other descriptors wider than 128 are
+    projected with pca, narrower ones are zero-padded. Rows are then L2 normalized and scaled to bytes the way SIFT is.
+    The scaling depends only on the arguments, so every image converted the same way stays matchable.
+    :param descriptors: (N, D) array of descriptors
+    :param binary: True if each byte holds 8 binary descriptor bits
+    :param pca: (mean, projection) from ::fit_descriptor_pca, required if non-binary descriptors are wider than 128
+    :param signed: True to scale by 256 around 128 for signed values, False to scale non-negative values by 512.
+    Defaults to True when projecting with pca, False otherwise. Values outside the byte range are clipped
+    :return: (N, 128) uint8 array of descriptors
+    """
+    np = _require_numpy()
+    desc_size = sift_desc_struct.size
+    descriptors = np.asarray(descriptors)
+    if signed is None:
+        signed = pca is not None
+    if binary:
+        descriptors = np.unpackbits(descriptors.astype(np.uint8), axis=1)
+        if pca is None and descriptors.shape[1] > desc_size:
+            fold = -(-descriptors.shape[1] // desc_size)
+            descriptors = np.pad(descriptors, ((0, 0), (0, fold * desc_size - descriptors.shape[1])))
+            descriptors = descriptors.reshape(len(descriptors), desc_size, fold).sum(axis=2)
+    descriptors = descriptors.astype(np.float32)
+    if pca is not None:
+        mean, projection = pca
+        descriptors = (descriptors - mean) @ projection.T
+    elif descriptors.shape[1] > desc_size:
+        raise ValueError(str(descriptors.shape[1]) + " dimensional descriptors need a pca projection from "
+                         "fit_descriptor_pca to fit in " + str(desc_size))
+    if descriptors.shape[1] < desc_size:
+        descriptors = np.pad(descriptors, ((0, 0), (0, desc_size - descriptors.shape[1])))
+    norms = np.linalg.norm(descriptors, axis=1, keepdims=True)
+    descriptors /= np.maximum(norms, np.finfo(np.float32).tiny)
+    if signed:
+        descriptors = descriptors * 256 + 128
+    else:
+        descriptors *= 512
+    return np.clip(np.rint(descriptors), 0, 255).astype(np.uint8)
+
+def _sift_descriptor_block(descriptors, adapt=None, binary=False, pca=None, signed=None):
+    """
+    Gets the (N, 128) uint8 descriptor block of a .sift file. Whether descriptors are converted depends only on their
+    dtype and the arguments, never on their values, so every image written the same way stays matchable.
+    :param descriptors: (N, D) array of descriptors
+    :param adapt: True to convert with ::adapt_descriptors, False to write the values as bytes. By default float
+    descriptors are converted and integer ones are written as bytes. binary and pca always convert
+    :param binary: passed to ::adapt_descriptors
+    :param pca: passed to ::adapt_descriptors
+    :param signed: passed to ::adapt_descriptors
+    :return: (N, 128) uint8 array of descriptors
+    """
+    np = _require_numpy()
+    desc_size = sift_desc_struct.size
+    if adapt is None:
+        adapt = descriptors.dtype.kind == 'f' or binary or pca is not None
+    elif not adapt and (binary or pca is not None):
+        raise ValueError("Binary or pca projected descriptors have to be converted with adapt_descriptors")
+    if adapt:
+        return adapt_descriptors(descriptors, binary=binary, pca=pca, signed=signed)
+    if descriptors.ndim != 2 or descriptors.shape[1] > desc_size:
+        raise ValueError("Descriptors of shape " + str(descriptors.shape) + " do not fit in " + str(desc_size) +
+                         " bytes, convert them with adapt_descriptors")
+    if descriptors.dtype != np.uint8:
+        # e.g. openCV's SIFT returns float32 descriptors that hold byte values
+        if descriptors.size and (descriptors.min() < 0 or descriptors.max() > 255 or
+                                 not np.array_equal(descriptors, np.rint(descriptors))):
+            raise ValueError("Descriptors written as bytes must hold integers from 0 to 255")
+        descriptors = descriptors.astype(np.uint8)
+    if descriptors.shape[1] < desc_size:
+        descriptors = np.pad(descriptors, ((0, 0), (0, desc_size - descriptors.shape[1])))
+    return descriptors
+
+def write_vsfm_sift_arrays(positions, sizes, angles, descriptors, filename=None, colors=None, pca=None, signed=None,
+                           adapt=None, binary=False):
+    """
+    Writes keypoints and descriptors held in numpy arrays to a VSFM-readable '.sift' file. The header, location block
+    and descriptor block are each written with a single call, so this is much faster than ::write_vsfm_sift
+    when exporting many features.
+    :param positions: (N, 2) array of x, y pixel positions
+    :param sizes: (N,) array of keypoint sizes
+    :param angles: (N,) array of keypoint angles in degrees, as used by openCV
+    :param descriptors: (N, 128) uint8 array of descriptors. Integer descriptors are written as bytes, zero-padded if
+    narrower, and float descriptors are converted with ::adapt_descriptors, unless adapt says otherwise
+    :param filename: Filename to save this file to. If not provided, will be 'features.sift' in the same path
+    :param colors: (N, 3) uint8 array of RGB colors, e.g. from ::sample_colors. Written as black if not provided
+    :param pca: (mean, projection) from ::fit_descriptor_pca. When given every descriptor is projected with it,
+    including (N, 128) uint8 ones, so files written with the same pca stay matchable
+    :param signed: scaling passed to ::adapt_descriptors when the descriptors are converted
+    :param adapt: True to always convert the descriptors with ::adapt_descriptors, False to write them as bytes,
+    e.g. for the float32 descriptors of openCV's SIFT which already hold byte values
+    :param binary: True for packed binary descriptors such as ORB's (N, 32) uint8 matrix, which are unpacked and
+    converted with ::adapt_descriptors instead of being written as bytes
+    :return: True
+    """
+    _require_numpy()
+    if filename is None:
+        filename = 'features.sift'
+    positions = np.asarray(positions)
+    nfeatures = len(positions)
+    locations = np.zeros(nfeatures, dtype=sift_loc_dtype)
+    locations['x'] = positions[:, 0]
+    locations['y'] = positions[:, 1]
+    locations['size'] = sizes
+    locations['angle'] = np.asarray(angles) * tau / 360
+    if colors is not None:
+        locations['color'] = colors
+    descriptors = np.asarray(descriptors)
+    if len(descriptors) != nfeatures:
+        raise ValueError(str(len(descriptors)) + " descriptors given for " + str(nfeatures) + " keypoints")
+    descriptors = _sift_descriptor_block(descriptors, adapt, binary, pca, signed)
+    logger.debug("Now writing " + str(nfeatures) + " features to vsfm binary 'sift' file " + filename)
+    with open(filename, 'wb') as fileobj:
+        fileobj.write(_pack_sift_header(nfeatures))
+        fileobj.write(locations)
+        fileobj.write(np.ascontiguousarray(descriptors))
+        fileobj.write(sift_eof_marker)
     return True
 
+def sample_colors(image, positions, bgr=False):
+    """
+    Gets the color of the image under each keypoint in a single gather, to fill the color channel of a .sift file
+    :param image: (H, W, 3) or (H, W) image array
+    :param positions: (N, 2) array of x, y pixel positions
+    :param bgr: True if the image channels are in openCV's BGR order, they are returned as RGB
+    :return: (N, 3) uint8 array of RGB colors
+    """
+    np = _require_numpy()
+    image = np.asarray(image)
+    positions = np.asarray(positions)
+    cols = np.clip(np.rint(positions[:, 0]).astype(np.intp), 0, image.shape[1] - 1)
+    rows = np.clip(np.rint(positions[:, 1]).astype(np.intp), 0, image.shape[0] - 1)
+    colors = image[rows, cols]
+    if colors.ndim == 1:
+        colors = np.repeat(colors[:, None], 3, axis=1)
+    elif bgr:
+        colors = colors[:, 2::-1]
+    return colors[:, 0:3].astype(np.uint8)
+
 def write_feature_matches(matches_list, filenames, match_path=None):
     """
     This function writes the list of matched features to a keypoint matching text file which is readable bt VSFM
@@ -160,45 +702,288 @@ def write_feature_matches(matches_list, filenames, match_path=None):
             fileobj.write(" ".join([str(match.queryIdx) for match in matches]) + "\n")
             fileobj.write(" ".join([str(match.trainIdx) for match in matches]) + "\n")
 
-def start_vsfm(port=None, vsfm_binary_path=default_path):
+def _format_match_block(block):
+    """
+    Formats the three lines of one image pair in a feature match file
+    :param block: tuple of (filename_a, filename_b, query_idx, train_idx), the indices as lists or integer arrays
+    :return: string for this pair
+    """
+    filename_a, filename_b, query_idx, train_idx = block
+    if hasattr(query_idx, 'tolist'):
+        query_idx = query_idx.tolist()
+    if hasattr(train_idx, 'tolist'):
+        train_idx = train_idx.tolist()
+    return (filename_a + " " + filename_b + " " + str(len(query_idx)) + "\n" +
+            " ".join(map(str, query_idx)) + "\n" +
+            " ".join(map(str, train_idx)) + "\n")
+
+def _format_match_blocks(blocks):
+    """
+    Formats a chunk of image pairs in one process pool task, see ::_format_match_block
+    :param blocks: list of (filename_a, filename_b, query_idx, train_idx) tuples
+    :return: string for these pairs
+    """
+    return ''.join([_format_match_block(block) for block in blocks])
+
+def write_feature_match_arrays(pair_matches, filenames, match_path=None, workers=None, buffer_size=1 << 20):
+    """
+    Writes matched feature indices to a keypoint matching text file which is readable by VSFM. The output is the same
+    as ::write_feature_matches, but the indices are given as arrays rather than lists of openCV DMatch objects.
+    :param pair_matches: iterable of (i, j, query_idx, train_idx), where i and j index filenames and query_idx,
+    train_idx are equal length integer arrays of matched keypoint indices
+    :param filenames: filenames of the .sift files which are matched.
+    :param match_path: Output path of the text file to be read by VSFM
+    :param workers: if given, the pair blocks are formatted in a process pool of this size. Only a few chunks per
+    worker are in flight at a time, so memory does not grow with the number of pairs
+    :param buffer_size: size in bytes of the file write buffer
+    :return: None
+    """
+    if match_path is None:
+        match_path = 'kp_matches.txt'
+    blocks = ((filenames[i], filenames[j], query_idx, train_idx) for i, j, query_idx, train_idx in pair_matches)
+    with open(match_path, 'w', buffering=buffer_size) as fileobj:
+        if workers is None:
+            for block in blocks:
+                fileobj.write(_format_match_block(block))
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+            pending = collections.deque()
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                for chunk in iter(lambda: list(itertools.islice(blocks, 16)), []):
+                    pending.append(executor.submit(_format_match_blocks, chunk))
+                    if len(pending) >= 4 * workers:
+                        fileobj.write(pending.popleft().result())
+                while pending:
+                    fileobj.write(pending.popleft().result())
+
+def _parse_match_indices(line, count):
+    """
+    Parses one line of space separated keypoint indices from a feature match file
+    :param line: bytes of the line
+    :param count: number of indices expected on the line
+    :return: int64 array of indices
+    """
+    with warnings.catch_warnings():
+        # Older numpy versions only warn when a token can not be parsed, and return the indices before it
+        warnings.simplefilter('error', DeprecationWarning)
+        try:
+            indices = np.fromstring(line.strip(), dtype=np.int64, sep=' ')
+        except DeprecationWarning as error:
+            raise ValueError(str(error))
+    if len(indices) != count:
+        raise ValueError("Expected " + str(count) + " match indices but found " + str(len(indices)))
+    return indices
+
+def _split_match_header(header, image_names=None):
+    """
+    Splits the 'image_a image_b count' header line of one image pair. Filenames may contain spaces, so when the line
+    has more than one space the split giving two of image_names is used, or without image_names the split giving two
+    files in the same directory
+    :param header: bytes of the header line
+    :param image_names: set of the filenames in the file, or None
+    :return: tuple of (image_a, image_b, count)
+    """
+    pair, count = header.decode('utf-8').strip().rsplit(None, 1)
+    splits = [(pair[0:i], pair[i + 1:]) for i, char in enumerate(pair) if char == ' ']
+    if len(splits) > 1:
+        if image_names is not None:
+            splits = [split for split in splits if split[0] in image_names and split[1] in image_names]
+        else:
+            splits = [split for split in splits if os.path.dirname(split[0]) == os.path.dirname(split[1])]
+    if len(splits) != 1:
+        raise ValueError("Could not split the filenames of the match header '" + pair + "', pass image_names")
+    return splits[0][0], splits[0][1], int(count)
+
+def _read_match_block(fileobj, image_names=None):
+    """
+    Reads the three lines of one image pair from a feature match file opened in binary mode
+    :param fileobj: the open match file
+    :param image_names: set of the filenames in the file, see ::_split_match_header
+    :return: tuple of (image_a, image_b, query_idx, train_idx), or None at the end of the file
+    """
+    header = fileobj.readline()
+    while header and not header.strip():
+        header = fileobj.readline()
+    if not header:
+        return None
+    image_a, image_b, count = _split_match_header(header, image_names)
+    query_idx = _parse_match_indices(fileobj.readline(), count)
+    train_idx = _parse_match_indices(fileobj.readline(), count)
+    return image_a, image_b, query_idx, train_idx
+
+def iter_feature_matches(match_path, image_names=None):
+    """
+    Reads a keypoint matching text file, as written by ::write_feature_matches, one image pair at a time
+    :param match_path: path of the match text file
+    :param image_names: filenames used in the file. Only needed to read filenames with spaces in them, unless both
+    images of each pair are in the same directory
+    :return: generator of (image_a, image_b, query_idx, train_idx) tuples, the indices as int64 arrays
+    """
+    _require_numpy()
+    if image_names is not None:
+        image_names = set(image_names)
+    with open(match_path, 'rb') as fileobj:
+        block = _read_match_block(fileobj, image_names)
+        while block is not None:
+            yield block
+            block = _read_match_block(fileobj, image_names)
+
+def index_feature_matches(match_path, image_names=None):
+    """
+    Builds an index of where each image pair starts in a keypoint matching text file. The index lines are skipped
+    rather than parsed, so this is much faster than reading the whole file.
+    :param match_path: path of the match text file
+    :param image_names: filenames used in the file, see ::iter_feature_matches
+    :return: dictionary of {(image_a, image_b): byte offset}
+    """
+    if image_names is not None:
+        image_names = set(image_names)
+    index = {}
+    with open(match_path, 'rb') as fileobj:
+        offset = fileobj.tell()
+        header = fileobj.readline()
+        while header:
+            if header.strip():
+                image_a, image_b = _split_match_header(header, image_names)[0:2]
+                index[(image_a, image_b)] = offset
+                fileobj.readline()
+                fileobj.readline()
+            offset = fileobj.tell()
+            header = fileobj.readline()
+    return index
+
+def read_feature_match_pair(match_path, image_a, image_b, index=None, image_names=None):
+    """
+    Reads the matches of a single image pair from a keypoint matching text file
+    :param match_path: path of the match text file
+    :param image_a: first filename of the pair, as written in the file
+    :param image_b: second filename of the pair
+    :param index: index from ::index_feature_matches, built if not given
+    :param image_names: filenames used in the file, see ::iter_feature_matches
+    :return: tuple of (query_idx, train_idx) int64 arrays
+    """
+    _require_numpy()
+    if image_names is not None:
+        image_names = set(image_names)
+    if index is None:
+        index = index_feature_matches(match_path, image_names)
+    with open(match_path, 'rb') as fileobj:
+        fileobj.seek(index[(image_a, image_b)])
+        return _read_match_block(fileobj, image_names)[2:4]
+
+def _free_port():
+    """
+    Finds a free port by binding to port 0 and letting the OS choose
+    :return: port number
+    """
+    tmp_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    tmp_sock.bind(('', 0))
+    port = int(tmp_sock.getsockname()[1])
+    tmp_sock.close()
+    return port
+
+def launch_vsfm(port=None, vsfm_binary_path=None):
+    """
+    Starts VSFM listening on a port and keeps the process handle
+    :param port: Port number to open, defaults to a random free one
+    :param vsfm_binary_path: the path to VSFM.exe, found by ::find_vsfm_binary if not given
+    :return: tuple of the port and the subprocess.Popen of VSFM
+    """
+    if vsfm_binary_path is None:
+        vsfm_binary_path = find_vsfm_binary()
+    if port is None:
+        port = _free_port()
+        logger.info("Binding to port " + str(port))
+    cmd = [vsfm_binary_path, 'listen+log', str(port)]
+    logger.debug("Sending cmd: " + str(cmd))
+    return port, subprocess.Popen(cmd)
+
+def start_vsfm(port=None, vsfm_binary_path=None):
     """
     Starts VSFM, binds it to a socket, opens the socket interface, sets up a logger and waits.
     :param port: Port number to open, defaults to a random one
-    :param vsfm_binary_path: the path to VSFM.exe, defaults from the vsfm_data file
+    :param vsfm_binary_path: the path to VSFM.exe, found by ::find_vsfm_binary if not given
     :return: port that was opened
     """
-    # 'start program'
-    if port is None:
-        tmp_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        tmp_sock.bind(('',0))
-        port = int(tmp_sock.getsockname()[1])
-        tmp_sock.close()
-        logger.info("Binding to port " + str(port))
-    cmd = '"{}" listen+log {}'.format(vsfm_binary_path, port)
-    # Opens up VSFM and begins the socket.
-    logger.debug("Sending cmd: " + cmd)
-    vsfm_subprocess = subprocess.Popen(cmd, shell=True) # this needs changed from shell=True
-    return port
+    return launch_vsfm(port, vsfm_binary_path)[0]
 
-def open_socket(port, host='localhost', wait=True):
+def open_socket(port, host='localhost', wait=True, timeout=30, process=None, banner_timeout=1.0):
     """
-    Opens the socket over the host, and specifies if we have to wait for the connection
+    Opens the socket over the host, and specifies if we have to wait for the connection.
+    While waiting, connections are retried with exponential backoff until VSFM is listening or the timeout passes.
+    Once connected, VSFM's first log line is waited for up to banner_timeout, and kept for the next response read.
     :param port: Port to be opened
     :param host: machine that is hosting vsfm. Defaults to localhost
     :param wait: True/false if we need to wait to connect
-    :return:
+    :param timeout: total time in seconds to wait for VSFM to start listening
+    :param process: subprocess.Popen of VSFM, if given a process that exits while waiting fails immediately
+    :param banner_timeout: time in seconds to wait for the first line from VSFM after connecting
+    :return: the connected socket
     """
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    for _ in range(10):
+    begin = time.time()
+    delay = 0.01
+    while True:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         try:
             sock.connect((host, port))
-            logger.debug("Socket connected on " + host + " to port " + port)
             break
-        except:
-            time.sleep(0.1)
-    time.sleep(0.05)
+        except OSError:
+            sock.close()
+            if not wait:
+                raise
+        if process is not None and process.poll() is not None:
+            raise ChildProcessError("VSFM exited with code " + str(process.returncode) + " before listening on port " +
+                                    str(port))
+        remaining = timeout - (time.time() - begin)
+        if remaining <= 0:
+            raise TimeoutError("VSFM was not listening on " + host + " port " + str(port) + " after " +
+                               str(timeout) + " seconds")
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, 0.5)
+    logger.debug("Socket connected on " + host + " to port " + str(port))
+    if banner_timeout:
+        with selectors.DefaultSelector() as selector:
+            selector.register(sock, selectors.EVENT_READ)
+            if selector.select(banner_timeout):
+                banner = sock.recv(4096)
+                if not banner:
+                    sock.close()
+                    raise ConnectionError("VSFM closed the connection on port " + str(port))
+                _response_buffers[sock] = banner
+                logger.debug("VSFM ready: " + str(banner))
     return sock
 
+def connect_vsfm(port=None, vsfm_binary_path=None, host='localhost', timeout=30):
+    """
+    Starts VSFM and waits until it is ready to receive commands
+    :param port: Port number to open, defaults to a random free one
+    :param vsfm_binary_path: the path to VSFM.exe, found by ::find_vsfm_binary if not given
+    :param host: machine that is hosting vsfm. Defaults to localhost
+    :param timeout: total time in seconds to wait for VSFM to start listening
+    :return: VSFMSession connected to the new VSFM process
+    """
+    port, process = launch_vsfm(port, vsfm_binary_path)
+    try:
+        sock = open_socket(port, host, timeout=timeout, process=process)
+    except Exception:
+        if process.poll() is None:
+            process.kill()
+        raise
+    return VSFMSession(port, process, sock)
+
+def _vsfm_command_bytes(number, param=None):
+    """
+    Builds the line sent to VSFM for a command
+    :param number: the integer command
+    :param param: any single parameter to send with it
+    :return: encoded command line
+    """
+    if param is None:
+        cmd = str(number) + '\n'
+    else:
+        cmd = str(number) + " " + param + '\n'
+    return cmd.encode()
+
 def send_vsfm_command_num(open_socket, number, param=None, wait=False, timeout=60):
     """
     This function sends a VSFM command via its direct number from the documentation of VSFM.
@@ -208,74 +993,613 @@ def send_vsfm_command_num(open_socket, number, param=None, wait=False, timeout=6
     :param param: any single parameter to send with it
     :param wait: if we should wait for a response
     :param timeout: how long we should wait for a response at maximum
-    :return:
+    :return: True/False if VSFM completed the command when waiting, otherwise True
     """
     logger.debug("Sending command #" + str(number))
-    if param is None:
-        cmd = str(number) + '\n'
-    else:
-        cmd = str(number) + " " + param + '\n'
-    cmd_bytes = cmd.encode()
-    open_socket.sendall(cmd_bytes)
+    open_socket.sendall(_vsfm_command_bytes(number, param))
+    _pending_acks[open_socket] = _pending_acks.get(open_socket, 0) + 1
     if wait:
-        wait_until_complete(open_socket, timeout)
+        return wait_until_complete(open_socket, timeout)
     return True
 
 def send_vsfm_command_tup(open_socket, tuple_command, param=None, wait=False, timeout=60):
     """
     Sends a VSFM command as a tuple object. This tuple is just strings corresponding to the menu invoked.
     :param open_socket: The open socket to VSFM
-    :param tuple_command: The command to be sent, e.g ('file', 'open_multi_images')
+    :param tuple_command: The command to be sent, e.g ('file', 'open_multi_images'), or as a dotted string
+    e.g 'file.open_multi_images'
     :param param: The parameter if any sent along the command line
     :param wait: weather or not to wait for the command to finish
     :param timeout: total timeout to wait for a command to finish
-    :return:
+    :return: the result of ::send_vsfm_command_num, or None if the command was not found
     """
     logger.debug("Sending command: " + str(tuple_command))
     try:
-        last = vsfm_command_dict
-        for command in tuple_command:
-            last = last[command]
-        send_vsfm_command_num(open_socket, last, param, wait, timeout)
-    except ValueError:
+        number = vsfm_command_number(tuple_command)
+    except KeyError:
         logger.error("Command '" + str(tuple_command) + "' not found")
+        return None
+    return send_vsfm_command_num(open_socket, number, param, wait, timeout)
+
+def send_vsfm_commands(open_socket, commands, wait=True, timeout=60):
+    """
+    Sends a batch of VSFM commands in a single write, instead of one round trip per command.
+    All of the command numbers are looked up before anything is sent, so an unknown command sends nothing.
+    :param open_socket: The open socket to VSFM
+    :param commands: sequence of (tuple_command, param) pairs, param may be None
+    :param wait: if True, read responses until every command has been acknowledged
+    :param timeout: total timeout to wait for all of the commands to finish
+    :return: tuple of the number of commands acknowledged and the list of lines received
+    """
+    batch = [_vsfm_command_bytes(vsfm_command_number(tuple_command), param) for tuple_command, param in commands]
+    logger.debug("Sending " + str(len(batch)) + " commands in one batch")
+    open_socket.sendall(b''.join(batch))
+    _pending_acks[open_socket] = _pending_acks.get(open_socket, 0) + len(batch)
+    if not wait:
+        return 0, []
+    begin = time.time()
+    transcript = []
+    acknowledged = 0
+    while acknowledged < len(batch):
+        remaining = None if timeout is None else max(0, timeout - (time.time() - begin))
+        complete, lines = read_vsfm_response(open_socket, remaining)
+        transcript.extend(lines)
+        if not complete:
+            break
+        acknowledged += 1
+    logger.info(str(acknowledged) + " of " + str(len(batch)) + " commands acknowledged")
+    return acknowledged, transcript
+
+def _image_file_info(path, hash_contents):
+    """
+    Gets the size and optionally a hash of the contents of an image file, used by ::filter_images
+    :param path: path of the image
+    :param hash_contents: True to hash the file contents
+    :return: tuple of the size in bytes and the hex digest, or None if not hashed
+    """
+    size = os.path.getsize(path)
+    if not hash_contents:
+        return size, None
+    digest = hashlib.sha1()
+    with open(path, 'rb') as fileobj:
+        for block in iter(lambda: fileobj.read(1 << 20), b''):
+            digest.update(block)
+    return size, digest.hexdigest()
+
+def filter_images(image_paths, extensions=('.jpg', '.png'), min_size=0, dedupe=False, workers=None):
+    """
+    Filters a list of images before loading them into VSFM. The files are checked on a thread pool.
+    :param image_paths: list of image paths
+    :param extensions: file extensions to keep, compared case insensitively
+    :param min_size: minimum file size in bytes to keep
+    :param dedupe: if True, only the first of several images with identical contents is kept
+    :param workers: number of threads used to check the files
+    :return: list of the image paths kept, in their original order
+    """
+    extensions = tuple(ext.lower() for ext in extensions)
+    candidates = [path for path in image_paths if path.lower().endswith(extensions)]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        infos = list(executor.map(_image_file_info, candidates, [dedupe] * len(candidates)))
+    kept = []
+    seen = set()
+    for path, (size, digest) in zip(candidates, infos):
+        if size < min_size:
+            continue
+        if dedupe:
+            if digest in seen:
+                logger.debug("Skipping duplicate image " + path)
+                continue
+            seen.add(digest)
+        kept.append(path)
+    logger.info(str(len(kept)) + " of " + str(len(image_paths)) + " images kept")
+    return kept
+
+def open_image_list(open_socket, image_paths, wait=True, timeout=60):
+    """
+    Loads many images into VSFM with a single open_multi_images command, by writing their paths to a list file
+    :param open_socket: The open socket to VSFM
+    :param image_paths: list of image paths, absolute paths are safest since VSFM resolves them itself
+    :param wait: if True, wait for VSFM to finish and remove the list file
+    :param timeout: total timeout to wait for the images to load
+    :return: True/False if VSFM completed when waiting, otherwise the path of the list file, which the caller should
+    remove once VSFM has read it
+    """
+    fileobj = tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False)
+    list_path = fileobj.name
+    # The list file is removed on any error, and once VSFM has read it when waiting
+    remove = True
+    try:
+        with fileobj:
+            fileobj.write('\n'.join(image_paths) + '\n')
+        logger.info("Opening " + str(len(image_paths)) + " images from list " + list_path)
+        send_vsfm_command_num(open_socket, vsfm_commands.file.open_multi_images, list_path)
+        if not wait:
+            remove = False
+            return list_path
+        return wait_until_complete(open_socket, timeout)
+    finally:
+        if remove:
+            os.remove(list_path)
+
+# VSFM acknowledges every command it has processed with this line
+vsfm_ack_flag = '*command processed*'
+# Lines that show VSFM finished something. Only vsfm_ack_flag completes a command, the others are progress messages
+# such as 'Loading images ... done' that VSFM may print while a command runs
+vsfm_complete_flags = [vsfm_ack_flag, 'done', 'finished']
+# Bytes received after the last complete line of each socket, kept for the next read
+_response_buffers = weakref.WeakKeyDictionary()
+# Number of commands sent on each socket whose complete flag has not been read yet
+_pending_acks = weakref.WeakKeyDictionary()
+
+def read_vsfm_response(sock, timeout=None):
+    """
+    Reads lines from VSFM until one of them contains the acknowledgement VSFM sends after processing a command,
+    vsfm_ack_flag. The byte stream is split on newlines before the flag is checked, so a flag split across two reads
+    is still found. Anything received after the acknowledgement is kept for the next call on the same socket.
+    :param sock: The socket that is already opened
+    :param timeout: Time in seconds to wait for the acknowledgement, None to wait forever
+    :return: tuple of True/False if the acknowledgement was found, and the list of lines received
+    """
+    begin = time.time()
+    transcript = []
+    buffer = _response_buffers.pop(sock, b'')
+    with selectors.DefaultSelector() as selector:
+        selector.register(sock, selectors.EVENT_READ)
+        while True:
+            while b'\n' in buffer:
+                line_bin, buffer = buffer.split(b'\n', 1)
+                line = line_bin.rstrip(b'\r').decode('utf-8', 'replace')
+                logger.debug("VSFM: " + line)
+                transcript.append(line)
+                if vsfm_ack_flag in line:
+                    logger.info("VSFM close flag found: " + line)
+                    _response_buffers[sock] = buffer
+                    if _pending_acks.get(sock, 0) > 0:
+                        _pending_acks[sock] -= 1
+                    return True, transcript
+            remaining = None
+            if timeout is not None:
+                remaining = timeout - (time.time() - begin)
+                if remaining <= 0:
+                    logger.error("Timeout exceeded")
+                    _response_buffers[sock] = buffer
+                    return False, transcript
+            if not selector.select(remaining):
+                continue
+            bytes_rec = sock.recv(4096)
+            if not bytes_rec:
+                logger.error("VSFM closed the connection")
+                if buffer:
+                    transcript.append(buffer.decode('utf-8', 'replace'))
+                return False, transcript
+            buffer += bytes_rec
 
 def wait_until_complete(sock, timeout=None):
     """
-    Waits until VSFM receives a complete flag
+    Waits until VSFM receives a complete flag. The socket is watched with a selector, so this wakes up as soon as VSFM
+    sends anything and uses no CPU while VSFM is busy.
     :param timeout: Time in seconds that all processes will be completed by. Suggests very long time, like 10min
-    :return:
+    :return: True if a complete flag was found, False on timeout or if VSFM closed the connection
+    """
+    return read_vsfm_response(sock, timeout)[0]
+
+def discard_vsfm_responses(sock, timeout=None):
+    """
+    Reads and throws away the responses to every command still pending on a socket, then anything else VSFM has
+    already sent, so the next wait only sees the responses to commands sent after this call
+    :param sock: The socket that is already opened
+    :param timeout: Time in seconds to wait for the pending commands to complete, None to wait forever
+    :return: True if every pending command completed, False on timeout or if VSFM closed the connection
     """
-    # time.sleep(0.2)
-    # set socket non-blocking
-    sock.setblocking(0)
-    time.sleep(0.1)
-    waiting = True
     begin = time.time()
-    vsfm_complete_flags = ['*command processed*', 'done', 'finished']
-    bytes_rec = b''
-    while waiting:
-        # Read the buffer until its empty
-        # Then check the last set of chars for one of the complete flags
-        try:
-            bytes_rec = sock.recv(256)
-            # If the socket has no data, this is an error
-            logger.debug("Buffer is: " + str(bytes_rec))
-            time.sleep(0.05)
-        except:
-            logger.debug("Buffer is empty, checking for complete flags.")
-            time.sleep(0.2)
-            for flag in vsfm_complete_flags:
-                if str(bytes_rec).find(flag) == -1:
-                    time.sleep(0.2)
-                # exit command not yet processed
-                else:
-                    logger.info("VSFM close flag found: " + str(bytes_rec))
-                    waiting = False
-        if timeout is not None:
-            if time.time() - begin > timeout:
+    while _pending_acks.get(sock, 0) > 0:
+        remaining = None if timeout is None else max(0, timeout - (time.time() - begin))
+        if not read_vsfm_response(sock, remaining)[0]:
+            return False
+    _response_buffers.pop(sock, None)
+    with selectors.DefaultSelector() as selector:
+        selector.register(sock, selectors.EVENT_READ)
+        while selector.select(0):
+            if not sock.recv(4096):
+                logger.error("VSFM closed the connection")
+                return False
+    return True
+
+class AsyncVSFM(object):
+    """
+    An asyncio client for the VSFM socket interface, so that one event loop can drive many VSFM instances.
+    asyncio is imported when the client connects, to keep importing vsfmpy cheap.
+    Usage:
+    async with AsyncVSFM(port) as vsfm:
+        await vsfm.send_command(('sfm', 'reconstruct_sparse'), wait=True)
+    """
+    def __init__(self, port, host='localhost'):
+        """
+        Setup the connection details, the connection is opened by ::connect
+        :param port: Port VSFM is listening on
+        :param host: machine that is hosting vsfm. Defaults to localhost
+        """
+        self.port = port
+        self.host = host
+        self.reader = None
+        self.writer = None
+
+    async def connect(self):
+        """
+        Opens the connection to VSFM
+        :return: self
+        """
+        import asyncio
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        logger.debug("Async socket connected on " + self.host + " to port " + str(self.port))
+        return self
+
+    async def close(self):
+        """
+        Closes the connection to VSFM
+        """
+        if self.writer is not None:
+            self.writer.close()
+            await self.writer.wait_closed()
+            self.reader = None
+            self.writer = None
+
+    async def __aenter__(self):
+        return await self.connect()
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def send_command_num(self, number, param=None, wait=False, timeout=60):
+        """
+        Sends a VSFM command via its direct number from the documentation of VSFM.
+        :param number: the integer command you want to send
+        :param param: any single parameter to send with it
+        :param wait: if we should wait for a response
+        :param timeout: how long we should wait for a response at maximum
+        :return: True/False if VSFM completed the command when waiting, otherwise True
+        """
+        logger.debug("Sending command #" + str(number))
+        self.writer.write(_vsfm_command_bytes(number, param))
+        await self.writer.drain()
+        if wait:
+            return await self.wait_until_complete(timeout)
+        return True
+
+    async def send_command(self, tuple_command, param=None, wait=False, timeout=60):
+        """
+        Sends a VSFM command as a tuple of the menu names, e.g ('file', 'open_multi_images')
+        :param tuple_command: The command to be sent
+        :param param: The parameter if any sent along the command line
+        :param wait: weather or not to wait for the command to finish
+        :param timeout: total timeout to wait for a command to finish
+        :return: the result of ::send_command_num
+        """
+        logger.debug("Sending command: " + str(tuple_command))
+        return await self.send_command_num(vsfm_command_number(tuple_command), param, wait, timeout)
+
+    async def wait_until_complete(self, timeout=None):
+        """
+        Waits until VSFM sends a complete flag
+        :param timeout: Time in seconds to wait for a complete flag, None to wait forever
+        :return: True if a complete flag was found, False on timeout or if VSFM closed the connection
+        """
+        return (await self.read_response(timeout))[0]
+
+    async def read_response(self, timeout=None):
+        """
+        Reads lines from VSFM until one of them contains a complete flag, see ::read_vsfm_response
+        :param timeout: Time in seconds to wait for a complete flag, None to wait forever
+        :return: tuple of True/False if a complete flag was found, and the list of lines received
+        """
+        import asyncio
+        transcript = []
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while True:
+            remaining = None if deadline is None else deadline - loop.time()
+            try:
+                line_bin = await asyncio.wait_for(self.reader.readline(), remaining)
+            except asyncio.TimeoutError:
                 logger.error("Timeout exceeded")
-                waiting = False
+                return False, transcript
+            if not line_bin:
+                logger.error("VSFM closed the connection")
+                return False, transcript
+            line = line_bin.rstrip(b'\r\n').decode('utf-8', 'replace')
+            logger.debug("VSFM: " + line)
+            transcript.append(line)
+            if vsfm_ack_flag in line:
+                logger.info("VSFM close flag found: " + line)
+                return True, transcript
+
+class VSFMSession(object):
+    """
+    A connection to VSFM, holding the port, the socket and, if this session started VSFM, its process.
+    Sessions can be reused for many jobs and close VSFM when used as a context manager.
+    Every menu command in vsfm_command_dict is also available as a method, named from its menu path,
+    e.g. session.sfm_pairwise_compute_missing_match(wait=True)
+    Usage:
+    with VSFMSession.start() as vsfm:
+        vsfm.open_image_list(images)
+        vsfm.sfm_reconstruct_sparse(wait=True)
+    """
+    def __init__(self, port, process=None, sock=None, host='localhost', timeout=30):
+        """
+        Attaches to a VSFM which is listening on a port
+        :param port: Port VSFM is listening on
+        :param process: subprocess.Popen of VSFM if this session owns the process, it is closed with the session
+        :param sock: socket already connected to VSFM, one is opened if not given
+        :param host: machine that is hosting vsfm. Defaults to localhost
+        :param timeout: total time in seconds to wait for VSFM to start listening if the socket is opened here
+        """
+        self.port = port
+        self.process = process
+        self.host = host
+        if sock is None:
+            sock = open_socket(port, host, timeout=timeout, process=process)
+        self.sock = sock
+
+    @classmethod
+    def start(cls, port=None, vsfm_binary_path=None, host='localhost', timeout=30):
+        """
+        Starts VSFM and returns a session connected to it once it is ready, see ::connect_vsfm
+        """
+        return connect_vsfm(port, vsfm_binary_path, host, timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def send_command_num(self, number, param=None, wait=False, timeout=60):
+        """
+        Sends a command by number, see ::send_vsfm_command_num
+        """
+        return send_vsfm_command_num(self.sock, number, param, wait, timeout)
+
+    def send_command(self, tuple_command, param=None, wait=False, timeout=60):
+        """
+        Sends a command by its menu tuple, see ::send_vsfm_command_tup
+        """
+        return send_vsfm_command_tup(self.sock, tuple_command, param, wait, timeout)
+
+    def send_commands(self, commands, wait=True, timeout=60):
+        """
+        Sends a batch of commands in one write, see ::send_vsfm_commands
+        """
+        return send_vsfm_commands(self.sock, commands, wait, timeout)
+
+    def wait_until_complete(self, timeout=None):
+        """
+        Waits for VSFM to finish the last command, see ::wait_until_complete
+        :return: True if a complete flag was found, False otherwise
+        """
+        return wait_until_complete(self.sock, timeout)
+
+    def read_response(self, timeout=None):
+        """
+        Reads the lines VSFM sends until the last command finishes, see ::read_vsfm_response
+        :return: tuple of True/False if a complete flag was found, and the list of lines received
+        """
+        return read_vsfm_response(self.sock, timeout)
+
+    def open_image_list(self, image_paths, wait=True, timeout=60):
+        """
+        Loads many images with one command, see ::open_image_list
+        """
+        return open_image_list(self.sock, image_paths, wait, timeout)
+
+    def alive(self):
+        """
+        Checks that the process is still running and the socket has not been closed by VSFM
+        :return: True if the session can be used
+        """
+        if self.process is not None and self.process.poll() is not None:
+            return False
+        try:
+            with selectors.DefaultSelector() as selector:
+                selector.register(self.sock, selectors.EVENT_READ)
+                if selector.select(0) and not self.sock.recv(1, socket.MSG_PEEK):
+                    return False
+        except (OSError, ValueError):
+            return False
+        return True
+
+    def close(self, timeout=5):
+        """
+        Closes the socket. If this session owns the VSFM process, VSFM is asked to exit and is killed if it has not
+        exited within the timeout
+        :param timeout: seconds to wait for VSFM to exit
+        """
+        if self.process is not None:
+            try:
+                send_vsfm_command_tup(self.sock, ('file', 'exit_program'))
+            except OSError:
+                pass
+        self.sock.close()
+        if self.process is None:
+            return
+        try:
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            logger.warning("VSFM on port " + str(self.port) + " did not exit, killing it")
+            self.process.kill()
+            self.process.wait()
+
+def _session_command(tuple_command):
+    """
+    Builds a VSFMSession method which sends one menu command
+    :param tuple_command: the command tuple, e.g ('file', 'open_multi_images')
+    :return: the method
+    """
+    def command(self, param=None, wait=False, timeout=60):
+        return self.send_command(tuple_command, param, wait, timeout)
+    command.__doc__ = "Sends the " + str(tuple_command) + " command, see ::send_vsfm_command_tup"
+    return command
+
+for _tuple_command in vsfm_command_table:
+    if isinstance(_tuple_command, tuple):
+        _method_name = '_'.join(command_identifier(_tuple_command)).replace('__', '_')
+        if not hasattr(VSFMSession, _method_name):
+            setattr(VSFMSession, _method_name, _session_command(_tuple_command))
+
+class VSFMPool(object):
+    """
+    A pool of VSFM processes, each listening on its own free port, so several image sets can be processed at once.
+    The workers are started up front and kept warm between jobs: when a worker is returned its workspace is cleared
+    instead of restarting VSFM. Workers are health checked when they are returned and replaced if they have crashed.
+    Usage:
+    with VSFMPool(4) as pool:
+        with pool.worker() as vsfm:
+            vsfm.send_command(('sfm', 'reconstruct_sparse'), wait=True)
+    """
+    def __init__(self, size, vsfm_binary_path=None, host='localhost', reset_on_release=True,
+                 reset_timeout=60):
+        """
+        Starts the VSFM workers in parallel
+        :param size: number of VSFM processes to keep running
+        :param vsfm_binary_path: the path to VSFM.exe, found by ::find_vsfm_binary if not given
+        :param host: host the workers are connected on
+        :param reset_on_release: if True, clear the workspace of each worker when it is returned to the pool
+        :param reset_timeout: seconds to wait for the workspace to be cleared before the worker is replaced
+        """
+        self.vsfm_binary_path = vsfm_binary_path
+        self.host = host
+        self.reset_on_release = reset_on_release
+        self.reset_timeout = reset_timeout
+        self.workers = []
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        with ThreadPoolExecutor(max_workers=max(1, size)) as executor:
+            futures = [executor.submit(self._launch) for _ in range(size)]
+        errors = []
+        for future in futures:
+            try:
+                worker = future.result()
+            except Exception as error:
+                errors.append(error)
+                continue
+            self.workers.append(worker)
+            self._idle.put(worker)
+        if errors:
+            self.shutdown()
+            raise errors[0]
+
+    def _launch(self):
+        """
+        Starts one VSFM process and connects to it
+        :return: VSFMSession
+        """
+        return connect_vsfm(vsfm_binary_path=self.vsfm_binary_path, host=self.host)
+
+    def acquire(self, timeout=None):
+        """
+        Takes an idle worker from the pool, waiting for one to be released if all are busy
+        :param timeout: seconds to wait for a worker, None to wait forever
+        :return: VSFMSession
+        """
+        worker = self._idle.get(timeout=timeout)
+        if worker is not None and worker.alive():
+            return worker
+        try:
+            worker = self._replace(worker)
+        except Exception:
+            # Keep the slot, the next acquire tries to start VSFM again
+            self._idle.put(None)
+            raise
+        if worker is None:
+            raise RuntimeError("The VSFM pool has been shut down")
+        return worker
+
+    def release(self, worker):
+        """
+        Returns a worker to the pool, clearing its workspace, or replacing it if it has crashed.
+        If a replacement can not be started, the slot is kept and ::acquire tries again.
+        :param worker: VSFMSession from ::acquire
+        """
+        healthy = worker.alive()
+        if healthy and self.reset_on_release and not self._reset(worker):
+            logger.warning("VSFM on port " + str(worker.port) + " did not clear its workspace")
+            healthy = False
+        if not healthy:
+            try:
+                worker = self._replace(worker)
+            except Exception as error:
+                logger.error("Could not start a new VSFM: " + str(error))
+                worker = None
+        self._idle.put(worker)
+
+    def _reset(self, worker):
+        """
+        Clears the workspace of a worker so it can be reused for the next job. Responses left over from the last job
+        are discarded first, so only the acknowledgement of clear_workspace itself counts.
+        :param worker: VSFMSession to reset
+        :return: True if VSFM completed the command
+        """
+        try:
+            begin = time.time()
+            if not discard_vsfm_responses(worker.sock, self.reset_timeout):
+                return False
+            send_vsfm_command_num(worker.sock, vsfm_commands.sfm.clear_workspace)
+            return wait_until_complete(worker.sock, max(0, self.reset_timeout - (time.time() - begin)))
+        except OSError:
+            return False
+
+    def _replace(self, worker):
+        """
+        Replaces a dead or stuck worker with a new VSFM process
+        :param worker: the VSFMSession to replace, or None for a slot whose replacement failed to start
+        :return: the new VSFMSession, or None if the pool has been shut down
+        """
+        if worker is not None:
+            logger.warning("Replacing VSFM on port " + str(worker.port) + " with a new process")
+            with self._lock:
+                if worker in self.workers:
+                    self.workers.remove(worker)
+            worker.sock.close()
+            if worker.process.poll() is None:
+                worker.process.kill()
+                worker.process.wait()
+        if self._closed:
+            return None
+        new_worker = self._launch()
+        with self._lock:
+            if not self._closed:
+                self.workers.append(new_worker)
+                return new_worker
+        new_worker.close()
+        return None
+
+    @contextlib.contextmanager
+    def worker(self, timeout=None):
+        """
+        Context manager that acquires a worker and releases it afterwards
+        :param timeout: seconds to wait for a worker, None to wait forever
+        """
+        worker = self.acquire(timeout)
+        try:
+            yield worker
+        finally:
+            self.release(worker)
+
+    def shutdown(self):
+        """
+        Closes every worker in the pool
+        """
+        with self._lock:
+            self._closed = True
+            workers, self.workers = self.workers, []
+        for worker in workers:
+            worker.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
 
 def vsfm_of_img_dir(images_path = r'../testing/image sets/kermit', close=True):
     """
@@ -290,8 +1614,7 @@ def vsfm_of_img_dir(images_path = r'../testing/image sets/kermit', close=True):
     open_sock = open_socket(port)
 
     # Begin data processing
-    for image in images:
-        send_vsfm_command_tup(open_sock, ('file', 'open_multi_images'), images_path + os.sep+ image)
+    open_image_list(open_sock, [os.path.abspath(images_path + os.sep + image) for image in images])
     send_vsfm_command_tup(open_sock, ('view', 'image_thumbnails'))
     send_vsfm_command_tup(open_sock, ('sfm', 'pairwise', 'compute_missing_match'), wait=True)
     send_vsfm_command_tup(open_sock, ('sfm', 'reconstruct_sparse'), wait=True)